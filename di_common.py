@@ -11,29 +11,592 @@ Description:
     - standardized Jo-diff histogram plotting
     - consistent pickle output in legacy format
     - safe bin size computation
+    - vectorized domain selection
+    - single-pass Jo-diff summary statistics
+    - sampled outlier / zero Jo-diff warnings
+    - atomic (write-then-rename) output files
+    - selective reading of GSI diag variables
+    - single-listing diag file discovery
 ==============================================================
 """
 
 import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pickle
 import os
+import io
+from functools import lru_cache
+from netCDF4 import Dataset
+
+try:
+    import numexpr
+    HAS_NUMEXPR = True
+except ImportError:
+    HAS_NUMEXPR = False
+
+try:
+    from fast_histogram import histogram1d
+    HAS_FAST_HISTOGRAM = True
+except ImportError:
+    HAS_FAST_HISTOGRAM = False
+
+try:
+    import pyarrow  # noqa: F401  (Parquet engine for the diag cache)
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    prange = range
+
+
+# ============================================================
+# Utility: atomic output writes
+# ============================================================
+def write_bytes_atomic(outfile, data):
+    """
+    Write an in-memory payload to outfile via a temp file + os.replace.
+
+    The payload is produced before the file is opened (e.g. a BytesIO
+    figure), so the target is never left half-written
+    and the slow close/flush on network filesystems is a single write.
+    """
+    tmpfile = f"{outfile}.tmp"
+    with open(tmpfile, "wb") as f:
+        f.write(data)
+    os.replace(tmpfile, outfile)
+
+
+def write_pickle_atomic(outfile, obj):
+    """
+    Pickle obj to outfile (highest protocol) via a temp file + os.replace.
+
+    From protocol 5 on, NumPy arrays are reduced to PickleBuffers and
+    large ones are streamed straight from array memory into the file, so
+    unlike pickle.dumps no second, in-memory copy of the payload is built.
+    """
+    tmpfile = f"{outfile}.tmp"
+    with open(tmpfile, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfile, outfile)
+
+
+# ============================================================
+# Utility: diag file discovery
+# ============================================================
+def list_diag_files(diag_dir):
+    """
+    Return the set of file names in a cycle's diag directory.
+
+    One directory listing replaces a stat() per sensor; callers test
+    membership of e.g. f"diag_{sensor}_ges.{cycle}.nc4".
+    """
+    try:
+        with os.scandir(diag_dir) as it:
+            return {entry.name for entry in it}
+    except FileNotFoundError:
+        return set()
+
+
+# ============================================================
+# Utility: selective diag variable reading
+# ============================================================
+def load_diag_cols(path, cols):
+    """
+    Read only the requested 1-D variables from a GSI diag netCDF file.
+
+    Variables are returned as plain ndarrays under their netCDF names
+    (e.g. "Obs_Minus_Forecast_adjusted", "Analysis_Use_Flag"), in file
+    order, so the result lines up row-for-row with pyGSI's DataFrame.
+    Masked (fill) values become NaN, matching pyGSI.  Variables missing
+    from the file are skipped.
+    """
+    out = {}
+    with Dataset(path, mode="r") as f:
+        for var in cols:
+            if var not in f.variables:
+                continue
+            data = f.variables[var][:]
+            if np.ma.isMaskedArray(data):
+                if np.ma.is_masked(data):
+                    data = data.astype(np.float64).filled(np.nan)
+                else:
+                    data = data.data
+            out[var] = np.asarray(data)
+    return out
+
+
+def load_radiance_cols(path, cols):
+    """
+    load_diag_cols for radiance diags, with pyGSI's channel handling.
+
+    Channel_Index, a 1-based position in the file's channel table, is
+    replaced by the sensor channel number (sensor_chan), as in the
+    Channel level of pyGSI's Radiance.  pyGSI tiles sensor_chan over the
+    rows, which assumes the usual channel-cycling row order; looking it
+    up by Channel_Index gives the same values without that assumption.
+    The channel's use_flag is added per obs as "Use_Flag", for the
+    assimilated/monitored split.
+    """
+    data = load_diag_cols(path, list(cols) + ["sensor_chan", "use_flag"])
+    sensor_chan = data.pop("sensor_chan")
+    use_flag = data.pop("use_flag")
+    if "Channel_Index" in data:
+        pos = data["Channel_Index"].astype(np.intp) - 1
+        data["Channel_Index"] = sensor_chan[pos]
+        data["Use_Flag"] = use_flag[pos].astype(np.int8)
+    return data
+
+
+# ============================================================
+# Utility: per-point detail records
+# ============================================================
+def _narrow_detail(val):
+    """float -> float32; integers -> int16 when every value fits."""
+    val = np.asarray(val)
+    if val.dtype.kind == "f":
+        return val.astype(np.float32, copy=False)
+    if val.dtype.kind in "iu":
+        i16 = np.iinfo(np.int16)
+        if val.size == 0 or (val.min() >= i16.min and val.max() <= i16.max):
+            return val.astype(np.int16, copy=False)
+    return val
+
+
+def pack_detail(fields):
+    """
+    Pack equal-length per-point arrays into one structured ndarray.
+
+    fields maps the detail names (jo_diff, latitude, ...) to arrays.
+    Floats are stored as float32 (the precision of the diag files) and
+    small integers such as observation type or channel as int16.  The
+    record pickles as a single contiguous buffer, and readers still
+    index it by name, as with the former dict: data["latitude"].
+    """
+    fields = {name: _narrow_detail(val) for name, val in fields.items()}
+    n = len(next(iter(fields.values())))
+    rec = np.empty(n, dtype=[(name, val.dtype) for name, val in fields.items()])
+    for name, val in fields.items():
+        rec[name] = val
+    return rec
+
+
+def write_detail(stem, fields):
+    """
+    Write one sensor's per-point detail arrays to stem + ".pkl" or ".npz".
+
+    The format is chosen with DI_DETAIL_FORMAT: "pkl" (default) pickles
+    the pack_detail record; "npz" stores each field as its own
+    uncompressed .npy member, so readers load only the columns they
+    use (the spatial plots need just latitude/longitude).
+    """
+    if os.environ.get("DI_DETAIL_FORMAT", "pkl") != "npz":
+        write_pickle_atomic(f"{stem}.pkl", pack_detail(fields))
+        return
+
+    outfile = f"{stem}.npz"
+    tmpfile = f"{outfile}.tmp"
+    with open(tmpfile, "wb") as f:
+        np.savez(f, **{name: _narrow_detail(val) for name, val in fields.items()})
+    os.replace(tmpfile, outfile)
+
+
+# ============================================================
+# Utility: on-disk diag cache for re-runs
+# ============================================================
+def load_cached(path, reader, cols):
+    """
+    Read diag variables with reader, memoized as Parquet next to the nc4.
+
+    Enabled with DI_CACHE=1 (needs pyarrow).  The cache file,
+    path + ".di_cache.parquet", is used while it is newer than the nc4
+    and was written for the same cols; otherwise reader(path, cols)
+    reads the nc4 and its arrays are written back.  A cache that cannot
+    be written, e.g. in a read-only diag directory, only costs a [WARN].
+
+    Parameters
+    ----------
+    path : str
+        Path to the diag nc4 file
+    reader : callable
+        reader(path, cols) -> dict of equal-length 1-D arrays, e.g.
+        load_diag_cols or load_radiance_cols
+    cols : list of str
+        Variables to read
+
+    Returns
+    -------
+    data : dict of ndarray
+    """
+    if os.environ.get("DI_CACHE") != "1" or not HAS_PYARROW:
+        return reader(path, cols)
+
+    cache = path + ".di_cache.parquet"
+    try:
+        if os.stat(cache).st_mtime >= os.stat(path).st_mtime:
+            df = pd.read_parquet(cache)
+            if df.attrs.get("di_cols") == list(cols):
+                return {name: df[name].to_numpy() for name in df.columns}
+    except (OSError, ValueError):
+        pass  # missing or unreadable: rebuild below
+
+    data = reader(path, cols)
+    try:
+        df = pd.DataFrame(data)
+        df.attrs["di_cols"] = list(cols)
+        buf = io.BytesIO()
+        df.to_parquet(buf, compression="zstd")
+        write_bytes_atomic(cache, buf.getvalue())
+    except OSError as err:
+        print(f"[WARN] Could not write diag cache {cache}: {err}")
+    return data
+
+
+# ============================================================
+# Utility: ges/anl row alignment check
+# ============================================================
+def diags_aligned(sensor, ges_cols, anl_cols):
+    """
+    Check that ges and anl diag rows describe the same observations.
+
+    GSI writes both diag files in the same observation order, so rows are
+    paired by position.  An index join is not usable: station ids and
+    channels repeat, and the QC flags in the index differ between the
+    ges and anl passes.  Instead the identifying columns (e.g. latitude,
+    longitude, channel) given in both dicts are compared element-wise.
+
+    Returns
+    -------
+    ok : bool
+        False (after printing a [WARN]) when lengths or values differ.
+    """
+    for name, ges_val in ges_cols.items():
+        ges_val = np.asarray(ges_val, dtype=np.float64)
+        anl_val = np.asarray(anl_cols[name], dtype=np.float64)
+        if ges_val.shape != anl_val.shape:
+            print(f"[WARN] {sensor}: ges/anl diag lengths differ "
+                  f"({ges_val.size} vs {anl_val.size}); skipping")
+            return False
+        if not np.array_equal(ges_val, anl_val, equal_nan=True):
+            n_bad = np.count_nonzero((ges_val != anl_val)
+                                     & ~(np.isnan(ges_val) & np.isnan(anl_val)))
+            print(f"[WARN] {sensor}: {n_bad} ges/anl rows differ in {name}; "
+                  "skipping")
+            return False
+    return True
+
+
+# ============================================================
+# Utility: vectorized domain selection
+# ============================================================
+@lru_cache(maxsize=None)
+def _compile_domain(domain_str):
+    """Code object for a domain string, compiled once per run."""
+    return compile(domain_str, "<domain>", "eval")
+
+
+def compute_domain_mask(domain_str, anl_latitude, anl_longitude):
+    """
+    Evaluate a domain selection string on whole lat/lon arrays.
+
+    The string is compiled once per run and evaluated with the full arrays bound
+    to ``anl_latitude``/``anl_longitude``, so expressions written with
+    ``&``/``|`` (e.g. the rectangular sub-domain in di_driver.sh) give a
+    boolean mask in a single pass.  numexpr is used when available;
+    expressions that only work on scalars (``and``/``or``) fall back to
+    a per-point evaluation of the same compiled code.
+
+    Returns
+    -------
+    mask : ndarray of bool, same shape as anl_latitude
+    """
+    anl_latitude = np.asarray(anl_latitude, dtype=np.float64)
+    anl_longitude = np.asarray(anl_longitude, dtype=np.float64)
+    local_dict = {"anl_latitude": anl_latitude, "anl_longitude": anl_longitude}
+
+    mask = None
+    if HAS_NUMEXPR:
+        try:
+            mask = numexpr.evaluate(domain_str, local_dict=local_dict)
+        except Exception:
+            mask = None
+
+    if mask is None:
+        domain_code = _compile_domain(domain_str)
+        try:
+            mask = eval(domain_code, {"np": np}, local_dict)
+        except ValueError:
+            # "truth value of an array is ambiguous": scalar-only expression
+            mask = np.fromiter(
+                (eval(domain_code, {"np": np},
+                      {"anl_latitude": la, "anl_longitude": lo})
+                 for la, lo in zip(anl_latitude.tolist(), anl_longitude.tolist())),
+                dtype=bool, count=anl_latitude.size)
+
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape != anl_latitude.shape:
+        mask = np.broadcast_to(mask, anl_latitude.shape).copy()
+    return mask
+
+
+# ============================================================
+# Utility: Jo-diff kernel
+# ============================================================
+def compute_jo_diff(anl_omf, ges_omf, inv_err):
+    """
+    Jo-diff = (anl_omf**2 - ges_omf**2) * inv_err**2, element-wise.
+
+    numexpr (when installed) fuses the expression into one pass over
+    memory; otherwise the squares are formed once and combined in place
+    so no extra full-size temporaries are allocated.
+    """
+    if HAS_NUMEXPR:
+        return numexpr.evaluate("(a * a - g * g) * (e * e)",
+                                local_dict={"a": anl_omf, "g": ges_omf, "e": inv_err})
+    jo = anl_omf * anl_omf
+    jo -= ges_omf * ges_omf
+    jo *= inv_err * inv_err
+    return jo
+
+
+# ============================================================
+# Utility: fused obs selection + Jo-diff
+# ============================================================
+_SELECT_CHUNK = 1 << 16
+
+
+def _select_jo_loop(anl_omf, ges_omf, inv_err, anl_flag, ges_flag, domain_mask):
+    """Count kept obs per chunk, then fill each chunk's slice in parallel."""
+    n = anl_omf.size
+    nchunk = (n + _SELECT_CHUNK - 1) // _SELECT_CHUNK
+    counts = np.zeros(nchunk + 1, np.int64)
+    for c in prange(nchunk):
+        k = 0
+        for i in range(c * _SELECT_CHUNK, min((c + 1) * _SELECT_CHUNK, n)):
+            if (inv_err[i] != 0 and anl_flag[i] == 1 and ges_flag[i] == 1
+                    and domain_mask[i]):
+                k += 1
+        counts[c + 1] = k
+    offsets = np.cumsum(counts)
+
+    orig_idx = np.empty(offsets[nchunk], np.int64)
+    jo = np.empty(offsets[nchunk], anl_omf.dtype)
+    for c in prange(nchunk):
+        k = offsets[c]
+        for i in range(c * _SELECT_CHUNK, min((c + 1) * _SELECT_CHUNK, n)):
+            e = inv_err[i]
+            if e != 0 and anl_flag[i] == 1 and ges_flag[i] == 1 and domain_mask[i]:
+                a = anl_omf[i]
+                g = ges_omf[i]
+                orig_idx[k] = i
+                jo[k] = (a * a - g * g) * (e * e)
+                k += 1
+    return orig_idx, jo
+
+
+if HAS_NUMBA:
+    _select_jo_kernel = njit(parallel=True, cache=True)(_select_jo_loop)
+else:
+    def _select_jo_kernel(anl_omf, ges_omf, inv_err, anl_flag, ges_flag, domain_mask):
+        mask = (inv_err != 0) & (anl_flag == 1) & (ges_flag == 1) & domain_mask
+        return (np.flatnonzero(mask),
+                compute_jo_diff(anl_omf[mask], ges_omf[mask], inv_err[mask]))
+
+
+def select_jo_diff(anl_omf, ges_omf, inv_err, anl_flag, ges_flag, domain_mask):
+    """
+    Select assimilated obs inside the domain and compute their Jo-diff.
+
+    An obs is kept when inv_err != 0, both use flags are 1 and
+    domain_mask is True.  With numba the test and the Jo-diff are fused
+    into one parallel pass, with no full-size boolean temporaries;
+    otherwise the mask is built with NumPy.
+
+    Returns
+    -------
+    orig_idx : ndarray of int64
+        Diag row of each kept obs, in file order
+    jo_diffs : ndarray
+        Jo-diff of each kept obs, in the dtype of anl_omf
+    """
+    domain_mask = np.broadcast_to(np.asarray(domain_mask, dtype=np.bool_),
+                                  anl_omf.shape)
+    if HAS_NUMBA:
+        domain_mask = np.ascontiguousarray(domain_mask)
+    return _select_jo_kernel(anl_omf, ges_omf, inv_err, anl_flag, ges_flag,
+                             domain_mask)
+
+
+# ============================================================
+# Utility: single-pass Jo-diff summary
+# ============================================================
+def _as_float_array(values):
+    """Contiguous float array; float32 is kept, anything else -> float64."""
+    arr = np.ascontiguousarray(values)
+    if arr.dtype not in (np.float32, np.float64):
+        arr = arr.astype(np.float64)
+    return arr
+
+
+def _jo_summary_loop(jo):
+    """Accumulate sum, sum of squares, min, max and outlier/zero counts."""
+    sum_jo = 0.0
+    sum_sq = 0.0
+    mn = np.inf
+    mx = -np.inf
+    n_large = 0
+    n_zero = 0
+    for i in range(jo.size):
+        j = jo[i]
+        sum_jo += j
+        sum_sq += j * j
+        if j < mn:
+            mn = j
+        if j > mx:
+            mx = j
+        if abs(j) > 25.0:
+            n_large += 1
+        elif j == 0.0:
+            n_zero += 1
+    return sum_jo, sum_sq, mn, mx, n_large, n_zero
+
+
+if HAS_NUMBA:
+    # reassoc/contract only: lets the reduction vectorize while keeping
+    # NaN and signed-zero semantics intact
+    _jo_summary_kernel = njit(cache=True, fastmath={"reassoc", "contract"})(_jo_summary_loop)
+else:
+    def _jo_summary_kernel(jo):
+        jo64 = jo.astype(np.float64, copy=False)
+        return (jo64.sum(), np.dot(jo64, jo64), jo.min(), jo.max(),
+                np.count_nonzero(np.abs(jo) > 25), np.count_nonzero(jo == 0))
+
+
+def summarize_jo(jo_diffs):
+    """
+    Summarize Jo-diff values in one pass over the data.
+
+    float32 input is read as-is; sums are always accumulated in float64.
+
+    Returns
+    -------
+    stats : dict
+        n, sum, mean, std, min, max, max_abs, count_large (|Jo-diff| > 25)
+        and count_zero (Jo-diff == 0).
+    """
+    jo = _as_float_array(jo_diffs)
+    n = jo.size
+    if n == 0:
+        return {"n": 0, "sum": 0.0, "mean": 0.0, "std": 0.0, "min": 0.0,
+                "max": 0.0, "max_abs": 0.0, "count_large": 0, "count_zero": 0}
+
+    sum_jo, sum_sq, mn, mx, n_large, n_zero = _jo_summary_kernel(jo)
+    mean = sum_jo / n
+    return {
+        "n": n,
+        "sum": float(sum_jo),
+        "mean": float(mean),
+        "std": float(np.sqrt(max(sum_sq / n - mean * mean, 0.0))),
+        "min": float(mn),
+        "max": float(mx),
+        "max_abs": float(max(abs(mn), abs(mx))),
+        "count_large": int(n_large),
+        "count_zero": int(n_zero),
+    }
+
+
+# ============================================================
+# Utility: sampled Jo-diff warnings
+# ============================================================
+def print_jo_warnings(sensor, jo_diffs, orig_idx, anl_omf, ges_omf, inv_err,
+                      warn_sample_limit=10, comp=None):
+    """
+    Print the first few |Jo-diff| > 25 and Jo-diff == 0 samples.
+
+    jo_diffs holds the selected obs only; orig_idx maps them back to
+    diag rows, which index anl_omf/ges_omf/inv_err and are the indices
+    printed.  For winds, comp labels each jo_diffs entry ("U"/"V") and
+    anl_omf/ges_omf map each label to that component's rows, so U and V
+    share one sample limit.  Samples are printed in record order, as
+    the per-row loop did; they are located with one vectorized pass, so
+    only the printed samples cost any Python work.
+
+    Returns
+    -------
+    count_large, count_zero : int
+    """
+    large_idx = np.flatnonzero(np.abs(jo_diffs) > 25)
+    zero_idx = np.flatnonzero(jo_diffs == 0)
+
+    shown = np.concatenate([large_idx[:max(warn_sample_limit, 0)],
+                            zero_idx[:max(warn_sample_limit, 0)]])
+    for k in np.sort(shown):
+        i = orig_idx[k]
+        if comp is None:
+            where, anl, ges = "", anl_omf[i], ges_omf[i]
+            anl_name, ges_name = "anl_omf", "ges_omf"
+        else:
+            c = comp[k]
+            where, anl, ges = f", comp={c}", anl_omf[c][i], ges_omf[c][i]
+            anl_name, ges_name = f"anl_{c.lower()}", f"ges_{c.lower()}"
+        if jo_diffs[k] == 0:
+            print(f"[WARN] {sensor}: index {i}{where} jo_diff == 0 "
+                  "(check obs or inv_obs_err)")
+        else:
+            print(f"[WARN] {sensor}: index {i}{where} jo_diff={jo_diffs[k]:.3f} "
+                  f"(|jo_diff| > 25, possible outlier)")
+            print(f"       {anl_name}={anl:.3f}, "
+                  f"{ges_name}={ges:.3f}, inv_err={inv_err[i]:.3f}")
+
+    return int(large_idx.size), int(zero_idx.size)
 
 
 # ============================================================
 # Utility: safe histogram bin computation
 # ============================================================
-def compute_bins(jo_diffs):
-    """Compute robust bin edges for Jo-diff histograms."""
-    if len(jo_diffs) == 0:
-        return np.arange(-1, 1, 0.1)
+def compute_bins(jo_diffs, stats=None):
+    """
+    Compute robust bin edges for Jo-diff histograms.
+
+    stats may be the summarize_jo() result for the same values; its
+    min/max/std are reused so the data is not scanned again.
+    """
     n = len(jo_diffs)
-    std = np.std(jo_diffs)
-    mx, mn = np.max(jo_diffs), np.min(jo_diffs)
-    binsize = (mx - mn) / np.sqrt(n) if n > 0 else 1.0
+    if n < 2:
+        return np.arange(-1, 1, 0.1)
+    if stats is None:
+        stats = summarize_jo(jo_diffs)
+    std = stats["std"]
+    mx, mn = stats["max"], stats["min"]
+    binsize = (mx - mn) / np.sqrt(n)
     if binsize <= 0:
         binsize = 0.1
-    return np.arange(-4 * std, 4 * std, binsize)
+    edges = np.arange(-4 * std, 4 * std, binsize)
+    if edges.size < 2:
+        # (near) constant values: one bin spanning the data
+        edges = np.array([mn, mn + binsize])
+    return edges
+
+
+def histogram_counts(values, edges):
+    """
+    Count values into the uniform bins described by edges.
+
+    Uses fast_histogram's dedicated uniform-bin kernel when installed,
+    otherwise np.histogram with an explicit range (its uniform fast path).
+    """
+    lo, hi, nbins = float(edges[0]), float(edges[-1]), len(edges) - 1
+    if HAS_FAST_HISTOGRAM:
+        return histogram1d(values, bins=nbins, range=(lo, hi))
+    counts, _ = np.histogram(values, bins=nbins, range=(lo, hi))
+    return counts
 
 
 # ============================================================
@@ -42,8 +605,8 @@ def compute_bins(jo_diffs):
 def plot_jo_histogram(sensor, yyyy, mm, dd, hh,
                       jo_diffs, inv_obs_errors,
                       count_assim, count_large, count_zero,
-                      data_anl, cycle,
-                      outdir="./figures"):
+                      total_size, cycle,
+                      outdir="./figures", dpi=300, ax=None):
     """
     Create and save a standardized Jo-diff histogram plot.
 
@@ -63,47 +626,62 @@ def plot_jo_histogram(sensor, yyyy, mm, dd, hh,
         Number of |Jo-diff| > 25
     count_zero : int
         Number of Jo-diff == 0
-    data_anl : DataFrame
-        Full diagnostic analysis data
+    total_size : int
+        Total number of observations in the analysis diag file
     cycle : str
         Cycle timestamp (YYYYMMDDHH)
     outdir : str
-        Output directory for figures
+        Output directory for figures (created by the caller)
+    dpi : int
+        Output resolution; e.g. 150 for quicker debug runs
+    ax : matplotlib Axes, optional
+        Axes to draw into, reused across sensors; it is cleared first
+        and left open.  By default a new figure is created and closed.
     """
 
-    os.makedirs(outdir, exist_ok=True)
+    jo_diffs = _as_float_array(jo_diffs)
+    jo_stats = summarize_jo(jo_diffs)
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    bins = compute_bins(jo_diffs)
-    ax.hist(jo_diffs, bins=bins, edgecolor="black")
+    own_fig = ax is None
+    if own_fig:
+        fig, ax = plt.subplots(figsize=(10, 6))
+    else:
+        fig = ax.figure
+        ax.clear()
+        for text in list(fig.texts):
+            text.remove()
+    edges = compute_bins(jo_diffs, jo_stats)
+    counts = histogram_counts(jo_diffs, edges)
+    ax.bar(edges[:-1], counts, width=np.diff(edges), edgecolor="black", align="edge")
     ax.set_xlabel("Jo Diff")
     ax.set_ylabel("Count")
     ax.set_title(f"{sensor} {yyyy}.{mm}{dd} {hh}UTC", fontsize=14)
     ax.grid(True)
 
     # --- Text annotations (standardized across all scripts) ---
-    plt.text(0.66, 0.82, f"Total Obs Size = {len(data_anl)}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.78, f"Total Assim Obs Size = {count_assim}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.74, f"Mean Jo-diff = {np.mean(jo_diffs):.4f}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.70, f"Sum Jo-diff = {np.sum(jo_diffs):.4f}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.66, f"Max Abs Jo-diff = {np.max(np.abs(jo_diffs)):.4f}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.62, f"Total Size, Jo-diff > 25 = {count_large}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.58, f"Total Size, Jo-diff is Zero = {count_zero}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.54, f"AVG Inv Obs Error = {np.mean(inv_obs_errors):.4f}", fontsize=12,
-             transform=plt.gcf().transFigure)
-    plt.text(0.66, 0.50, f"STD Inv Obs Error = {np.std(inv_obs_errors):.4f}", fontsize=12,
-             transform=plt.gcf().transFigure)
+    # One multiline artist; linespacing keeps the original 0.04 figure-
+    # fraction pitch between lines (0.04 * 6 in = 17.28 pt = 1.44 * 12 pt),
+    # and a multiline "baseline" anchors the last line, originally at 0.50.
+    inv_obs_errors = np.asarray(inv_obs_errors, dtype=np.float64)
+    stats_text = "\n".join([
+        f"Total Obs Size = {total_size}",
+        f"Total Assim Obs Size = {count_assim}",
+        f"Mean Jo-diff = {jo_stats['mean']:.4f}",
+        f"Sum Jo-diff = {jo_stats['sum']:.4f}",
+        f"Max Abs Jo-diff = {jo_stats['max_abs']:.4f}",
+        f"Total Size, Jo-diff > 25 = {count_large}",
+        f"Total Size, Jo-diff is Zero = {count_zero}",
+        f"AVG Inv Obs Error = {inv_obs_errors.mean():.4f}",
+        f"STD Inv Obs Error = {inv_obs_errors.std():.4f}",
+    ])
+    fig.text(0.66, 0.50, stats_text, fontsize=12, linespacing=1.44, va="baseline")
 
     outfile = os.path.join(outdir, f"{sensor}-{cycle}.png")
-    plt.savefig(outfile, dpi=300, bbox_inches="tight")
-    plt.close(fig)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    write_bytes_atomic(outfile, buf.getvalue())
+    if own_fig:
+        plt.close(fig)
     print(f"[FIG] Saved figure: {outfile}")
 
 
@@ -113,24 +691,42 @@ def plot_jo_histogram(sensor, yyyy, mm, dd, hh,
 def save_legacy_pickle(sensor_types,
                        total_size, assim_size,
                        mean_jo, sum_jo, max_abs_jo,
-                       cycle, label="conv", outdir="./pickle"):
+                       cycle, label="conv", outdir="./pickle", fmt=("pkl", "npz")):
     """
     Save results in the legacy 6-element pickle format.
 
     Format:
       [sensor_types, total_size, assim_size,
        mean_jo, sum_jo, max_abs_jo]
+
+    fmt is "pkl", "npz" or a tuple of both (the default).  "npz" writes
+    the same six fields as named arrays to {cycle}_{label}.npz via
+    np.savez_compressed; it loads without unpickling and is preferred
+    by scripts_post/generate_data_impact_figures.py when present.
+
+    outdir is expected to exist (created by the caller).  The stat
+    arrays are stored as given (np.asarray: no copy, dtype kept).
     """
-    os.makedirs(outdir, exist_ok=True)
     legacy_pickle = [
         sensor_types,
-        np.array(total_size),
-        np.array(assim_size),
-        np.array(mean_jo),
-        np.array(sum_jo),
-        np.array(max_abs_jo),
+        np.asarray(total_size),
+        np.asarray(assim_size),
+        np.asarray(mean_jo),
+        np.asarray(sum_jo),
+        np.asarray(max_abs_jo),
     ]
-    outfile = os.path.join(outdir, f"{cycle}_{label}.pkl")
-    with open(outfile, "wb") as f:
-        pickle.dump(legacy_pickle, f)
-    print(f"[DONE] Saved results to {outfile}")
+    for ext in ((fmt,) if isinstance(fmt, str) else fmt):
+        outfile = os.path.join(outdir, f"{cycle}_{label}.{ext}")
+        if ext == "npz":
+            buf = io.BytesIO()
+            np.savez_compressed(buf,
+                                sensor_types=np.asarray(sensor_types),
+                                total_size=legacy_pickle[1],
+                                assim_size=legacy_pickle[2],
+                                mean_jo=legacy_pickle[3],
+                                sum_jo=legacy_pickle[4],
+                                max_abs_jo=legacy_pickle[5])
+            write_bytes_atomic(outfile, buf.getvalue())
+        else:
+            write_pickle_atomic(outfile, legacy_pickle)
+        print(f"[DONE] Saved results to {outfile}")
@@ -19,14 +19,136 @@ Description:
 """
 
 import os
-import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import numpy as np
-from pyGSI.diags import Conventional
-from di_common import plot_jo_histogram, save_legacy_pickle
-import pickle
-
-
-def analyze_conv(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=False):
+from di_common import (plot_jo_histogram, save_legacy_pickle,
+                       compute_domain_mask, summarize_jo, load_diag_cols,
+                       list_diag_files, print_jo_warnings, write_detail,
+                       select_jo_diff, diags_aligned, load_cached)
+import matplotlib.pyplot as plt
+
+
+# diag variables read from the ges / anl files
+CONV_GES_VARS = ["Obs_Minus_Forecast_adjusted", "Analysis_Use_Flag",
+                 "Latitude", "Longitude", "Prep_QC_Mark", "Setup_QC_Mark"]
+CONV_ANL_VARS = ["Obs_Minus_Forecast_adjusted", "Errinv_Final",
+                 "Latitude", "Longitude", "Analysis_Use_Flag",
+                 "Pressure", "Observation_Type"]
+
+
+def _process_sensor(sensor, yyyy, mm, dd, hh, data_path, domain_str, save_detail,
+                    ax=None):
+    """
+    Compute Jo-diff for one conventional sensor, plot its histogram and
+    optionally save the per-point detail pickle.  ax, if given, is a
+    histogram Axes reused across sensors.
+
+    Returns (total_size, assim_size, mean_jo, sum_jo, max_abs_jo), or
+    None when the sensor has no assimilated obs or its ges/anl diags
+    do not line up.
+    """
+    cycle = f"{yyyy}{mm}{dd}{hh}"
+    file_prefix = os.path.join(data_path, hh)
+    diag_ges_path = f"{file_prefix}/diag_{sensor}_ges.{cycle}.nc4"
+    diag_anl_path = f"{file_prefix}/diag_{sensor}_anl.{cycle}.nc4"
+
+    print(f"=== Processing {sensor} ===")
+
+    # --- Load only the diag variables we need ---
+    diag_ges = load_cached(diag_ges_path, load_diag_cols, CONV_GES_VARS)
+    diag_anl = load_cached(diag_anl_path, load_diag_cols, CONV_ANL_VARS)
+
+    # --- ges and anl rows are paired by position; make sure they match ---
+    if not diags_aligned(sensor,
+                         {k: diag_ges[k] for k in ("Latitude", "Longitude")},
+                         {k: diag_anl[k] for k in ("Latitude", "Longitude")}):
+        return None
+
+    # float32 (as stored in the diag file) halves memory traffic in the
+    # bulk arithmetic; reductions are done in float64 by summarize_jo
+    anl_omf = diag_anl["Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+    ges_omf = diag_ges["Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+    inv_err = diag_anl["Errinv_Final"].astype(np.float32, copy=False)
+    anl_lat = diag_anl["Latitude"].astype(np.float64)
+    anl_lon = diag_anl["Longitude"].astype(np.float64)
+    anl_flag = diag_anl["Analysis_Use_Flag"].astype(np.int8)
+    ges_flag = diag_ges["Analysis_Use_Flag"].astype(np.int8)
+    anl_press = diag_anl["Pressure"]
+    anl_obstype = diag_anl["Observation_Type"]
+    total_size = len(anl_omf)
+
+    # --- Data length summary (same split as pyGSI's analysis_use=True) ---
+    ges_qc_mark = diag_ges.get("Prep_QC_Mark", diag_ges.get("Setup_QC_Mark"))
+    print(f"  Length of data, total: {len(ges_omf)}")
+    print(f"  Length of data that were assimilated: "
+          f"{np.count_nonzero((ges_flag == 1) & (ges_qc_mark < 7))}")
+    print(f"  Length of data that were monitored: "
+          f"{np.count_nonzero((ges_flag == -1) & (ges_qc_mark > 7))}")
+    print(f"  Length of data that were rejected: "
+          f"{np.count_nonzero((ges_flag == -1) & (ges_qc_mark < 8))}")
+
+    # --- Apply domain filter if specified ---
+    domain_mask = compute_domain_mask(domain_str, anl_lat, anl_lon)
+
+    # --- Select assimilated obs (both ges and anl) inside the domain
+    #     and compute jo-diff with observation error info ---
+    orig_idx, jo_diffs = select_jo_diff(anl_omf, ges_omf, inv_err,
+                                        anl_flag, ges_flag, domain_mask)
+    inv_obs_errors = inv_err[orig_idx]
+    count_assim = int(jo_diffs.size)
+
+    # --- Collect detailed information ---
+    sensor_lat = anl_lat[orig_idx]
+    sensor_lon = anl_lon[orig_idx]
+    sensor_press = anl_press[orig_idx]      # Pressure
+    sensor_obstype = anl_obstype[orig_idx]  # Observation_Type
+
+    # --- Diagnostic Warnings ---
+    count_large, count_zero = print_jo_warnings(sensor, jo_diffs, orig_idx,
+                                                anl_omf, ges_omf, inv_err)
+
+    # --- Warning summary ---
+    print(f"[INFO] {sensor}: |jo_diff|>25 count = {count_large}")
+    print(f"[INFO] {sensor}: jo_diff == 0 count = {count_zero}")
+
+    # --- Save detailed info, plot histogram, and save overall stat ---
+    if count_assim > 0:
+
+        # --- Save detailed per-point data to pickle_detail/ ---
+        if save_detail:            
+
+            detail_dir  = "pickle_detail"
+            detail_file = os.path.join(detail_dir, f"{cycle}_{sensor}_detail")
+
+            detail_dict = {
+                "jo_diff": jo_diffs,
+                "inv_obs_errors": inv_obs_errors,
+                "latitude": sensor_lat,
+                "longitude": sensor_lon,
+                "pressure": sensor_press,
+                "observation_type": sensor_obstype
+            }
+
+            write_detail(detail_file, detail_dict)
+
+        # --- Continue with your normal workflow ---            
+        plot_jo_histogram(sensor, yyyy, mm, dd, hh,
+                          jo_diffs, inv_obs_errors,
+                          count_assim, count_large, count_zero,
+                          total_size, cycle, ax=ax)
+
+        # --- Return stats for this sensor ---
+        jo_stats = summarize_jo(jo_diffs)
+        return (total_size, count_assim,
+                jo_stats["mean"], jo_stats["sum"], jo_stats["max_abs"])
+
+    return None
+
+
+def analyze_conv(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=False,
+                 jobs=1):
     cycle = f"{yyyy}{mm}{dd}{hh}"
     sensor_types = ["conv_fed", "conv_ps", "conv_pw", "conv_q", "conv_rw", "conv_sst", "conv_t"]
 
@@ -37,125 +159,40 @@ def analyze_conv(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=Fal
     final_sum_jo_diff = np.zeros(n_sensor)
     final_max_abs_jo_diff = np.zeros(n_sensor)
 
-    for ss, sensor in enumerate(sensor_types):
-        file_prefix = os.path.join(data_path, hh)
-        diag_ges_path = f"{file_prefix}/diag_{sensor}_ges.{cycle}.nc4"
-        diag_anl_path = f"{file_prefix}/diag_{sensor}_anl.{cycle}.nc4"
+    # --- Output directories and available diag files, set up once ---
+    os.makedirs("./figures", exist_ok=True)
+    os.makedirs("./pickle", exist_ok=True)
+    if save_detail:
+        os.makedirs("./pickle_detail", exist_ok=True)
 
-        if not os.path.exists(diag_ges_path):
-            print(f"[WARN] Missing file for {sensor}: {diag_ges_path}")
+    file_prefix = os.path.join(data_path, hh)
+    existing = list_diag_files(file_prefix)
+    run_index = []
+    for ss, sensor in enumerate(sensor_types):
+        if f"diag_{sensor}_ges.{cycle}.nc4" not in existing:
+            print(f"[WARN] Missing file for {sensor}: "
+                  f"{file_prefix}/diag_{sensor}_ges.{cycle}.nc4")
             continue
-
-        print(f"=== Processing {sensor} ===")
-
-        # --- Load diagnostics ---
-        diag_ges = Conventional(diag_ges_path)
-        diag_anl = Conventional(diag_anl_path)
-
-        data_ges = diag_ges.get_data()
-        data_anl = diag_anl.get_data()
-        data_ges_qc = diag_ges.get_data(analysis_use=True)
-
-        # --- Data length summary ---
-        print(f"  Length of data, total: {len(data_ges)}")
-        print(f"  Length of data that were assimilated: {len(data_ges_qc['assimilated'])}")
-        print(f"  Length of data that were monitored: {len(data_ges_qc['monitored'])}")
-        print(f"  Length of data that were rejected: {len(data_ges_qc['rejected'])}")
-
-        # --- Initialize accumulators ---
-        jo_diffs, inv_obs_errors = [], []
-        sensor_lon, sensor_lat = [], []
-        sensor_press = []
-        sensor_obstype = []
-        
-        count_assim = 0
-        count_large = 0
-        count_zero = 0
-        warn_sample_limit = 10  # limit printed samples per sensor
-
-        # --- Main observation loop ---
-        for i in range(len(data_anl)):
-            # From the pyGSI/diag.py: 
-            #indices = ['Station_ID', 'Observation_Class', 'Observation_Type',
-            #           'Observation_Subtype', 'Pressure', 'Height',
-            #           'Analysis_Use_Flag']
-            
-            ges, anl = data_ges.iloc[i], data_anl.iloc[i]
-            inv_err = anl["errinv_final"]
-            if inv_err == 0:
-                continue
-            if int(ges.name[6]) != 1 or int(anl.name[6]) != 1:
-                continue
-
-            # --- Apply domain filter if specified ---
-            anl_latitude  = float(anl["latitude"])
-            anl_longitude = float(anl["longitude"])
-            if not eval(domain_str, {"anl_latitude": anl_latitude, "anl_longitude": anl_longitude}):
-                continue
-
-            # --- Compute jo-diff with observation error info --- 
-            jo_diff = (anl["omf_adjusted"] ** 2 - ges["omf_adjusted"] ** 2) * (inv_err ** 2)
-            jo_diffs.append(jo_diff)
-            inv_obs_errors.append(inv_err)
-            count_assim += 1
-            
-            # --- Collect detailed information ---
-            sensor_lat.append( anl_latitude )
-            sensor_lon.append( anl_longitude )
-            sensor_press.append( anl.name[4] ) # Pressure
-            sensor_obstype.append( anl.name[2] ) # Observation_Type
-
-            # --- Diagnostic Warnings ---
-            if abs(jo_diff) > 25:
-                count_large += 1
-                if count_large <= warn_sample_limit:
-                    print(f"[WARN] {sensor}: index {i} jo_diff={jo_diff:.3f} "
-                          f"(|jo_diff| > 25, possible outlier)")
-                    print(f"       anl_omf={anl['omf_adjusted']:.3f}, "
-                          f"ges_omf={ges['omf_adjusted']:.3f}, inv_err={inv_err:.3f}")
-            elif jo_diff == 0:
-                count_zero += 1
-                if count_zero <= warn_sample_limit:
-                    print(f"[WARN] {sensor}: index {i} jo_diff == 0 "
-                          "(check obs or inv_obs_err)")
-
-        # --- Warning summary ---
-        print(f"[INFO] {sensor}: |jo_diff|>25 count = {count_large}")
-        print(f"[INFO] {sensor}: jo_diff == 0 count = {count_zero}")
-
-        # --- Save detailed info, plot histogram, and save overall stat ---
-        if count_assim > 0:
-
-            # --- Save detailed per-point data to pickle_detail/ ---
-            if save_detail:            
-                
-                detail_dir  = "pickle_detail"
-                detail_file = os.path.join(detail_dir, f"{cycle}_{sensor}_detail.pkl")
-
-                detail_dict = {
-                    "jo_diff": np.array(jo_diffs),
-                    "inv_obs_errors": np.array(inv_obs_errors),
-                    "latitude": np.array(sensor_lat),
-                    "longitude": np.array(sensor_lon),
-                    "pressure": np.array(sensor_press),         
-                    "observation_type": np.array(sensor_obstype) 
-                }
-
-                with open(detail_file, "wb") as f:
-                    pickle.dump(detail_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
-
-            # --- Continue with your normal workflow ---            
-            plot_jo_histogram(sensor, yyyy, mm, dd, hh,
-                              jo_diffs, inv_obs_errors,
-                              count_assim, count_large, count_zero,
-                              data_anl, cycle)
-
-            # --- Save stats for this sensor ---
-            final_total_size[ss] = len(data_anl)
-            final_assim_size[ss] = count_assim
-            final_mean_jo_diff[ss] = np.mean(jo_diffs)
-            final_sum_jo_diff[ss] = np.sum(jo_diffs)
-            final_max_abs_jo_diff[ss] = np.max(np.abs(jo_diffs))
+        run_index.append(ss)
+    run_sensors = [sensor_types[ss] for ss in run_index]
+
+    # --- Sensors are independent: optionally run them in worker processes ---
+    sensor_args = (repeat(yyyy), repeat(mm), repeat(dd), repeat(hh),
+                   repeat(data_path), repeat(domain_str), repeat(save_detail))
+    if jobs > 1 and len(run_sensors) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(run_sensors))) as ex:
+            results = list(ex.map(_process_sensor, run_sensors, *sensor_args))
+    else:
+        # one histogram figure reused for every sensor
+        hist_fig, hist_ax = plt.subplots(figsize=(10, 6))
+        results = list(map(_process_sensor, run_sensors, *sensor_args, repeat(hist_ax)))
+        plt.close(hist_fig)
+
+    for ss, result in zip(run_index, results):
+        if result is None:
+            continue
+        (final_total_size[ss], final_assim_size[ss], final_mean_jo_diff[ss],
+         final_sum_jo_diff[ss], final_max_abs_jo_diff[ss]) = result
 
     # --- Save results (shared function) ---
     save_legacy_pickle(sensor_types,
@@ -166,16 +203,27 @@ def analyze_conv(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=Fal
                        final_max_abs_jo_diff,
                        cycle, label="conv")
 
-    
-if __name__ == "__main__":
-    if len(sys.argv) < 6:
-        sys.exit("Usage: di_conv.py YYYY MM DD HH DATAPATH [DOMAIN] [SAVE_DETAIL]")
 
-    yyyy, mm, dd, hh, data_path = sys.argv[1:6]
-    domain_str  = sys.argv[6] if len(sys.argv) > 6 else "True"
-    save_detail = sys.argv[7].lower() in ["true"] if len(sys.argv) > 7 else False
-
-    print(f"[INFO] Domain selection string: {domain_str}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Jo-diff statistics for conventional scalar observations.")
+    parser.add_argument("yyyy")
+    parser.add_argument("mm")
+    parser.add_argument("dd")
+    parser.add_argument("hh")
+    parser.add_argument("data_path")
+    parser.add_argument("domain_str", nargs="?", default="True",
+                        help="Domain selection expression in anl_latitude/anl_longitude")
+    parser.add_argument("save_detail", nargs="?", default="false",
+                        help="'true' to save per-point detail pickles")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes for the sensor loop")
+    args = parser.parse_args()
+
+    save_detail = args.save_detail.lower() in ["true"]
+
+    print(f"[INFO] Domain selection string: {args.domain_str}")
     print(f"[INFO] Save detailed pickle: {save_detail}")
 
-    analyze_conv(yyyy, mm, dd, hh, data_path, domain_str, save_detail)
+    analyze_conv(args.yyyy, args.mm, args.dd, args.hh, args.data_path,
+                 args.domain_str, save_detail, jobs=args.jobs)
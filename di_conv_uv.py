@@ -19,9 +19,20 @@ Description:
 import os
 import sys
 import numpy as np
-from pyGSI.diags import Conventional
-from di_common import plot_jo_histogram, save_legacy_pickle
-import pickle
+from di_common import (plot_jo_histogram, save_legacy_pickle,
+                       compute_domain_mask, summarize_jo, list_diag_files,
+                       write_detail, compute_jo_diff,
+                       select_jo_diff, diags_aligned, load_cached,
+                       load_diag_cols, print_jo_warnings)
+
+
+# diag variables read from the ges / anl files
+UV_GES_VARS = ["u_Obs_Minus_Forecast_adjusted", "v_Obs_Minus_Forecast_adjusted",
+               "Analysis_Use_Flag", "Latitude", "Longitude",
+               "Prep_QC_Mark", "Setup_QC_Mark"]
+UV_ANL_VARS = ["u_Obs_Minus_Forecast_adjusted", "v_Obs_Minus_Forecast_adjusted",
+               "Errinv_Final", "Analysis_Use_Flag", "Latitude", "Longitude",
+               "Pressure", "Observation_Type"]
 
 
 def analyze_conv_uv(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=False):
@@ -35,96 +46,91 @@ def analyze_conv_uv(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=
     final_sum_jo_diff = np.zeros(n_sensor)
     final_max_abs_jo_diff = np.zeros(n_sensor)
 
+    # --- Output directories and available diag files, set up once ---
+    os.makedirs("./figures", exist_ok=True)
+    os.makedirs("./pickle", exist_ok=True)
+    if save_detail:
+        os.makedirs("./pickle_detail", exist_ok=True)
+
+    file_prefix = os.path.join(data_path, hh)
+    existing = list_diag_files(file_prefix)
+
     for ss, sensor in enumerate(sensor_types):
-        file_prefix = os.path.join(data_path, hh)
         diag_ges_path = f"{file_prefix}/diag_{sensor}_ges.{cycle}.nc4"
         diag_anl_path = f"{file_prefix}/diag_{sensor}_anl.{cycle}.nc4"
 
-        if not os.path.exists(diag_ges_path):
+        if os.path.basename(diag_ges_path) not in existing:
             print(f"[WARN] Missing file for {sensor}: {diag_ges_path}")
             continue
 
         print(f"=== Processing {sensor} ===")
 
-        # --- Load diagnostics ---
-        diag_ges = Conventional(diag_ges_path)
-        diag_anl = Conventional(diag_anl_path)
+        # --- Load only the diag variables we need ---
+        diag_ges = load_cached(diag_ges_path, load_diag_cols, UV_GES_VARS)
+        diag_anl = load_cached(diag_anl_path, load_diag_cols, UV_ANL_VARS)
 
-        data_ges = diag_ges.get_data()
-        data_anl = diag_anl.get_data()
-        data_ges_qc = diag_ges.get_data(analysis_use=True)
-
-        # --- Data length summary ---
-        total_count = len(data_ges) * 2
-        assim_count = len(data_ges_qc["assimilated"]) * 2
-        monitor_count = len(data_ges_qc["monitored"]) * 2
-        reject_count = len(data_ges_qc["rejected"]) * 2
+        # --- ges and anl rows are paired by position; make sure they match ---
+        if not diags_aligned(sensor,
+                             {k: diag_ges[k] for k in ("Latitude", "Longitude")},
+                             {k: diag_anl[k] for k in ("Latitude", "Longitude")}):
+            continue
 
+        # --- Extract columns once as ndarrays ---
+        # float32 (as stored in the diag file) for the bulk arithmetic;
+        # reductions are done in float64 by summarize_jo
+        anl_u = diag_anl["u_Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+        anl_v = diag_anl["v_Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+        ges_u = diag_ges["u_Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+        ges_v = diag_ges["v_Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+        inv_err = diag_anl["Errinv_Final"].astype(np.float32, copy=False)
+        anl_lat = diag_anl["Latitude"].astype(np.float64)
+        anl_lon = diag_anl["Longitude"].astype(np.float64)
+        anl_flag = diag_anl["Analysis_Use_Flag"].astype(np.int8)
+        ges_flag = diag_ges["Analysis_Use_Flag"].astype(np.int8)
+        anl_press = diag_anl["Pressure"]
+        anl_obstype = diag_anl["Observation_Type"]
+
+        # --- Data length summary (same split as pyGSI's analysis_use=True,
+        #     two components per record) ---
+        ges_qc_mark = diag_ges.get("Prep_QC_Mark", diag_ges.get("Setup_QC_Mark"))
+        total_count = 2 * len(ges_u)
         print(f"  Length of data, total: {total_count}")
-        print(f"  Length of data that were assimilated: {assim_count}")
-        print(f"  Length of data that were monitored: {monitor_count}")
-        print(f"  Length of data that were rejected: {reject_count}")
-
-        # --- Initialize accumulators ---
-        jo_diffs, inv_obs_errors = [], []
-        sensor_lon, sensor_lat = [], []
-        sensor_press = []
-        sensor_obstype = []        
-        
-        count_assim = 0
-        count_large = 0
-        count_zero = 0
-        warn_sample_limit = 10  # limit printed samples per sensor
-
-        # --- Main observation loop ---
-        for i in range(len(data_anl)):
-            # From the pyGSI/diag.py: 
-            #indices = ['Station_ID', 'Observation_Class', 'Observation_Type',
-            #           'Observation_Subtype', 'Pressure', 'Height',
-            #           'Analysis_Use_Flag']         
-            
-            ges, anl = data_ges.iloc[i], data_anl.iloc[i]
-            inv_err = anl["errinv_final"]
-            if inv_err == 0:
-                continue
-            if int(ges.name[6]) != 1 or int(anl.name[6]) != 1:
-                continue
-
-            # --- Apply domain filter if specified ---
-            anl_latitude  = float(anl["latitude"])
-            anl_longitude = float(anl["longitude"])
-            if not eval(domain_str, {"anl_latitude": anl_latitude, "anl_longitude": anl_longitude}):
-                continue
-                
-            # --- Compute Jo-diff for each component separately ---
-            jo_diff_u = (anl["u_omf_adjusted"] ** 2 - ges["u_omf_adjusted"] ** 2) * (inv_err ** 2)
-            jo_diff_v = (anl["v_omf_adjusted"] ** 2 - ges["v_omf_adjusted"] ** 2) * (inv_err ** 2)
-
-            jo_diffs.extend([jo_diff_u, jo_diff_v])
-            inv_obs_errors.extend([inv_err, inv_err])
-            count_assim += 2  # two scalar observations per record
-
-            # --- Collect detailed information ---
-            sensor_lat.extend([anl_latitude, anl_latitude])
-            sensor_lon.extend([anl_longitude, anl_longitude])
-            sensor_press.extend([anl.name[4], anl.name[4]])   # Pressure
-            sensor_obstype.extend([anl.name[2], anl.name[2]]) # Observation type
-            
-            # --- Diagnostic Warnings (per component) ---
-            for comp_name, jo_val in zip(["U", "V"], [jo_diff_u, jo_diff_v]):
-                if abs(jo_val) > 25:
-                    count_large += 1
-                    if count_large <= warn_sample_limit:
-                        print(f"[WARN] {sensor}: index {i}, comp={comp_name} jo_diff={jo_val:.3f} "
-                              f"(|jo_diff| > 25, possible outlier)")
-                        print(f"       anl_{comp_name.lower()}={anl[f'{comp_name.lower()}_omf_adjusted']:.3f}, "
-                              f"ges_{comp_name.lower()}={ges[f'{comp_name.lower()}_omf_adjusted']:.3f}, "
-                              f"inv_err={inv_err:.3f}")
-                elif jo_val == 0:
-                    count_zero += 1
-                    if count_zero <= warn_sample_limit:
-                        print(f"[WARN] {sensor}: index {i}, comp={comp_name} jo_diff == 0 "
-                              "(check obs or inv_obs_err)")
+        print(f"  Length of data that were assimilated: "
+              f"{2 * np.count_nonzero((ges_flag == 1) & (ges_qc_mark < 7))}")
+        print(f"  Length of data that were monitored: "
+              f"{2 * np.count_nonzero((ges_flag == -1) & (ges_qc_mark > 7))}")
+        print(f"  Length of data that were rejected: "
+              f"{2 * np.count_nonzero((ges_flag == -1) & (ges_qc_mark < 8))}")
+
+        # --- Apply domain filter if specified ---
+        domain_mask = compute_domain_mask(domain_str, anl_lat, anl_lon)
+
+        # --- Select assimilated records (both ges and anl) inside the domain
+        #     and compute Jo-diff for each component separately ---
+        orig_idx, jo_u = select_jo_diff(anl_u, ges_u, inv_err,
+                                        anl_flag, ges_flag, domain_mask)
+        inv_err_sel = inv_err[orig_idx]
+        jo_v = compute_jo_diff(anl_v[orig_idx], ges_v[orig_idx], inv_err_sel)
+
+        # two scalar observations per record, interleaved as U, V
+        jo_diffs = np.empty(2 * jo_u.size, dtype=np.float32)
+        jo_diffs[0::2] = jo_u
+        jo_diffs[1::2] = jo_v
+        inv_obs_errors = np.repeat(inv_err_sel, 2)
+        count_assim = int(jo_diffs.size)
+
+        # --- Collect detailed information ---
+        sensor_lat = np.repeat(anl_lat[orig_idx], 2)
+        sensor_lon = np.repeat(anl_lon[orig_idx], 2)
+        sensor_press = np.repeat(anl_press[orig_idx], 2)      # Pressure
+        sensor_obstype = np.repeat(anl_obstype[orig_idx], 2)  # Observation type
+
+        # --- Diagnostic Warnings (U and V in record order, one sample limit) ---
+        comp = np.tile(np.array(["U", "V"]), jo_u.size)
+        count_large, count_zero = print_jo_warnings(sensor, jo_diffs, np.repeat(orig_idx, 2),
+                                                    {"U": anl_u, "V": anl_v},
+                                                    {"U": ges_u, "V": ges_v},
+                                                    inv_err, comp=comp)
 
         # --- Warning summary ---
         print(f"[INFO] {sensor}: |jo_diff|>25 count = {count_large}")
@@ -137,32 +143,32 @@ def analyze_conv_uv(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=
             if save_detail:            
                 
                 detail_dir  = "pickle_detail"
-                detail_file = os.path.join(detail_dir, f"{cycle}_{sensor}_detail.pkl")
+                detail_file = os.path.join(detail_dir, f"{cycle}_{sensor}_detail")
 
                 detail_dict = {
-                    "jo_diff": np.array(jo_diffs),
-                    "inv_obs_errors": np.array(inv_obs_errors),
-                    "latitude": np.array(sensor_lat),
-                    "longitude": np.array(sensor_lon),
-                    "pressure": np.array(sensor_press),         
-                    "observation_type": np.array(sensor_obstype) 
+                    "jo_diff": jo_diffs,
+                    "inv_obs_errors": inv_obs_errors,
+                    "latitude": sensor_lat,
+                    "longitude": sensor_lon,
+                    "pressure": sensor_press,
+                    "observation_type": sensor_obstype
                 }
 
-                with open(detail_file, "wb") as f:
-                    pickle.dump(detail_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+                write_detail(detail_file, detail_dict)
 
             # --- Continue with your normal workflow ---                        
             plot_jo_histogram(sensor, yyyy, mm, dd, hh,
                               jo_diffs, inv_obs_errors,
                               count_assim, count_large, count_zero,
-                              data_anl, cycle)
+                              len(anl_u), cycle)
 
             # --- Save stats for this sensor ---
             final_total_size[ss] = total_count
             final_assim_size[ss] = count_assim
-            final_mean_jo_diff[ss] = np.mean(jo_diffs)
-            final_sum_jo_diff[ss] = np.sum(jo_diffs)
-            final_max_abs_jo_diff[ss] = np.max(np.abs(jo_diffs))
+            jo_stats = summarize_jo(jo_diffs)
+            final_mean_jo_diff[ss] = jo_stats["mean"]
+            final_sum_jo_diff[ss] = jo_stats["sum"]
+            final_max_abs_jo_diff[ss] = jo_stats["max_abs"]
 
     # --- Save results (shared function) ---
     save_legacy_pickle(sensor_types,
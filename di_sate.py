@@ -11,7 +11,7 @@ Description:
   satellite radiance data (e.g., ABI, CrIS, ATMS).
 
   Features:
-    - Compatible with legacy pyGSI column names
+    - Reads the GSI diag variables directly with netCDF4
     - Uses shared plotting/saving utilities from di_common.py
     - Preserves figure text layout and pickle format
     - Easily select sensors via comment toggling
@@ -20,14 +20,156 @@ Description:
 """
 
 import os
-import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import numpy as np
-import pickle
-from pyGSI.diags import Radiance
-from di_common import plot_jo_histogram, save_legacy_pickle
-
-
-def analyze_sate(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=False):
+from di_common import (plot_jo_histogram, save_legacy_pickle, list_diag_files,
+                       write_pickle_atomic, write_detail, diags_aligned,
+                       load_cached, compute_domain_mask, select_jo_diff,
+                       summarize_jo, print_jo_warnings, load_radiance_cols)
+import matplotlib.pyplot as plt
+
+
+# diag variables read from the ges / anl files
+SATE_GES_VARS = ["Obs_Minus_Forecast_adjusted", "Inverse_Observation_Error",
+                 "QC_Flag", "Latitude", "Longitude", "Channel_Index"]
+SATE_ANL_VARS = ["Obs_Minus_Forecast_adjusted", "Inverse_Observation_Error",
+                 "QC_Flag", "Latitude", "Longitude", "Elevation", "Channel_Index"]
+
+
+def _process_sensor(sensor, yyyy, mm, dd, hh, data_path, domain_str, save_detail,
+                    ax=None):
+    """
+    Compute Jo-diff for one radiance sensor, plot its histogram and
+    optionally save the channel and per-point detail pickles.  ax, if
+    given, is a histogram Axes reused across sensors.
+
+    Returns (total_size, assim_size, mean_jo, sum_jo, max_abs_jo), or
+    None when the sensor has no assimilated obs or its ges/anl diags
+    do not line up.
+    """
+    cycle = f"{yyyy}{mm}{dd}{hh}"
+    file_prefix = os.path.join(data_path, hh)
+    diag_ges_path = f"{file_prefix}/diag_{sensor}_ges.{cycle}.nc4"
+    diag_anl_path = f"{file_prefix}/diag_{sensor}_anl.{cycle}.nc4"
+
+    print(f"=== Processing {sensor} ===")
+
+    # --- Load only the diag variables we need ---
+    diag_ges = load_cached(diag_ges_path, load_radiance_cols, SATE_GES_VARS)
+    diag_anl = load_cached(diag_anl_path, load_radiance_cols, SATE_ANL_VARS)
+
+    # --- ges and anl rows are paired by position; make sure they match ---
+    pos_vars = ("Latitude", "Longitude", "Channel_Index")
+    if not diags_aligned(sensor,
+                         {k: diag_ges[k] for k in pos_vars},
+                         {k: diag_anl[k] for k in pos_vars}):
+        return None
+
+    # --- Extract columns once as ndarrays ---
+    # float32 (as stored in the diag file) for the bulk arithmetic;
+    # reductions are done in float64 by summarize_jo
+    anl_omf = diag_anl["Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+    ges_omf = diag_ges["Obs_Minus_Forecast_adjusted"].astype(np.float32, copy=False)
+    inv_err = diag_anl["Inverse_Observation_Error"].astype(np.float32, copy=False)
+    ges_inv_err = diag_ges["Inverse_Observation_Error"]
+    anl_lat = diag_anl["Latitude"].astype(np.float64)
+    anl_lon = diag_anl["Longitude"].astype(np.float64)
+    anl_elevation = diag_anl.get("Elevation", np.full(anl_lat.shape, np.nan))
+    anl_channel = diag_anl["Channel_Index"]   # sensor channel number
+    ges_qc = diag_ges["QC_Flag"].astype(np.int8)
+    anl_qc = diag_anl["QC_Flag"].astype(np.int8)
+
+    # --- Data length summary (same split as pyGSI's analysis_use=True:
+    #     channels with use_flag == 1 are assimilated where
+    #     QC_Flag == 0 or inv_err != 0, rejected where QC_Flag != 0) ---
+    ges_use = diag_ges["Use_Flag"] == 1
+    print(f"  Length of data, total: {len(ges_omf)}")
+    print(f"  Length of data that were assimilated: "
+          f"{np.count_nonzero(ges_use & ((ges_qc == 0) | (ges_inv_err != 0)))}")
+    print(f"  Length of data that were monitored: {np.count_nonzero(~ges_use)}")
+    print(f"  Length of data that were rejected: "
+          f"{np.count_nonzero(ges_use & (ges_qc != 0))}")
+
+    # --- Apply domain filter if specified ---
+    domain_mask = compute_domain_mask(domain_str, anl_lat, anl_lon)
+
+    # --- Assimilated data: QC == 0 for both, valid inv_err, in domain.
+    #     QC == 0 becomes the use flag; NaN inv_err is dropped through the
+    #     anl flag, since select_jo_diff only tests inv_err != 0 ---
+    anl_flag = ((anl_qc == 0) & ~np.isnan(inv_err)).astype(np.int8)
+    ges_flag = (ges_qc == 0).astype(np.int8)
+
+    # --- Select the obs and compute Jo-diff with observation error info ---
+    orig_idx, jo_diffs = select_jo_diff(anl_omf, ges_omf, inv_err,
+                                        anl_flag, ges_flag, domain_mask)
+    inv_obs_errors = inv_err[orig_idx]
+    count_assim = int(jo_diffs.size)
+
+    # --- Collect detailed information ---
+    sensor_lat = anl_lat[orig_idx]
+    sensor_lon = anl_lon[orig_idx]
+    sensor_elevation = anl_elevation[orig_idx]
+    sensor_channel = anl_channel[orig_idx]
+
+    # --- Diagnostic Warnings ---
+    count_large, count_zero = print_jo_warnings(sensor, jo_diffs, orig_idx,
+                                                anl_omf, ges_omf, inv_err)
+
+    # --- Warning summary ---
+    print(f"[INFO] {sensor}: |jo_diff|>25 count = {count_large}")
+    print(f"[INFO] {sensor}: jo_diff == 0 count = {count_zero}")
+
+
+
+    # --- Optional per-channel metadata pickle (int16 channel, float32 lat/lon) ---
+    if save_detail and count_assim > 0:
+        filename = f"./pickle/{cycle}_sate_channel_{sensor}.pkl"
+        write_pickle_atomic(filename, [sensor, sensor_channel.astype(np.int16),
+                                       sensor_lat.astype(np.float32),
+                                       sensor_lon.astype(np.float32)])
+        print(f"[SAVE] Channel metadata: {filename}")
+
+
+
+    # --- Save detailed info, plot histogram, and save overall stat ---
+    if count_assim > 0:
+
+        # --- Save detailed per-point data to pickle_detail/ ---
+        if save_detail:            
+
+            detail_dir  = "pickle_sate_detail"
+            detail_file = os.path.join(detail_dir, f"{cycle}_{sensor}_detail")
+
+            detail_dict = {
+                "jo_diff": jo_diffs,
+                "inv_obs_errors": inv_obs_errors,
+                "latitude": sensor_lat,
+                "longitude": sensor_lon,
+                "elevation": sensor_elevation,
+                "channel": sensor_channel
+            }
+
+            write_detail(detail_file, detail_dict)
+
+        # --- Continue with your normal workflow ---  
+        plot_jo_histogram(sensor, yyyy, mm, dd, hh,
+                          jo_diffs, inv_obs_errors,
+                          count_assim, count_large, count_zero,
+                          len(anl_omf), cycle, ax=ax)
+
+        # --- Return stats for this sensor ---
+        jo_stats = summarize_jo(jo_diffs)
+        return (len(anl_omf), count_assim,
+                jo_stats["mean"], jo_stats["sum"], jo_stats["max_abs"])
+
+    return None
+
+
+
+def analyze_sate(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=False,
+                 jobs=1):
     cycle = f"{yyyy}{mm}{dd}{hh}"
 
     # ------------------------------------------------------------
@@ -48,151 +190,41 @@ def analyze_sate(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=Fal
     final_sum_jo_diff = np.zeros(n_sensor)
     final_max_abs_jo_diff = np.zeros(n_sensor)
 
-    for ss, sensor in enumerate(sensor_types):
-        file_prefix = os.path.join(data_path, hh)
-        diag_ges_path = f"{file_prefix}/diag_{sensor}_ges.{cycle}.nc4"
-        diag_anl_path = f"{file_prefix}/diag_{sensor}_anl.{cycle}.nc4"
+    # --- Output directories and available diag files, set up once ---
+    os.makedirs("./figures", exist_ok=True)
+    os.makedirs("./pickle", exist_ok=True)
+    if save_detail:
+        os.makedirs("./pickle_sate_detail", exist_ok=True)
 
-        if not os.path.exists(diag_ges_path):
-            print(f"[WARN] Missing file for {sensor}: {diag_ges_path}")
-            continue
+    file_prefix = os.path.join(data_path, hh)
+    existing = list_diag_files(file_prefix)
 
-        print(f"=== Processing {sensor} ===")
-
-        # --- Load diagnostics ---
-        diag_ges = Radiance(diag_ges_path)
-        diag_anl = Radiance(diag_anl_path)
-
-        data_ges = diag_ges.get_data()
-        data_anl = diag_anl.get_data()
-        data_ges_qc = diag_ges.get_data(analysis_use=True)
-
-        # --- Data length summary ---
-        print(f"  Length of data, total: {len(data_ges)}")
-        print(f"  Length of data that were assimilated: {len(data_ges_qc['assimilated'])}")
-        print(f"  Length of data that were monitored: {len(data_ges_qc['monitored'])}")
-        print(f"  Length of data that were rejected: {len(data_ges_qc['rejected'])}")
-
-        # --- Initialize accumulators ---
-        jo_diffs, inv_obs_errors = [], []
-        sensor_lon, sensor_lat = [], []
-        sensor_elevation = []
-        sensor_channel = []
-        
-        list_channel, list_latitude, list_longitude = [], [], []
-        
-        
-        count_assim = 0
-        count_large = 0
-        count_zero = 0
-        warn_sample_limit = 10  # limit printed samples per sensor
-
-        # --- Observation loop ---
-        for i in range(len(data_anl)):
-            ges_series = data_ges.iloc[i]
-            anl_series = data_anl.iloc[i]
-
-            ges_qc_flag = ges_series.name[1]
-            anl_qc_flag = anl_series.name[1]
-            
-            ges_omf = ges_series.get("omf_adjusted", np.nan)
-            anl_omf = anl_series.get("omf_adjusted", np.nan)
-            inv_err = anl_series.get("inverse_observation_error", np.nan)
-            if np.isnan(inv_err) or inv_err == 0:
-                continue
-
-            # --- Apply domain filter if specified ---
-            anl_latitude  = float(anl_series["latitude"])
-            anl_longitude = float(anl_series["longitude"])
-            
-            #anl_latitude  = anl_series.get("latitude", np.nan)
-            #anl_longitude = anl_series.get("longitude", np.nan)
-            
-            if not eval(domain_str, {"anl_latitude": anl_latitude, "anl_longitude": anl_longitude}):
-                continue
-
-            # Compute Jo-diff
-            jo_diff = (anl_omf**2 - ges_omf**2) * (inv_err**2)
-
-            if i % 200000 == 0:
-                print(f"  Processing i = {i}")
-
-            # Assimilated data: QC == 0 for both
-            if (int(ges_qc_flag) == 0) and (int(anl_qc_flag) == 0) and (inv_err != 0):
-                count_assim += 1
-                jo_diffs.append(jo_diff)
-                inv_obs_errors.append(inv_err)
-
-                list_channel.append(anl_series.get("channel_index", np.nan))
-                list_latitude.append(anl_series.get("latitude", np.nan))
-                list_longitude.append(anl_series.get("longitude", np.nan))
-                
-                sensor_lat.append( anl_latitude )
-                sensor_lon.append( anl_longitude )
-                sensor_elevation.append( anl_series.get("elevation", np.nan) )
-                sensor_channel.append( anl_series.get("channel_index", np.nan) )
-
-                # --- Diagnostic Warnings ---
-                if abs(jo_diff) > 25:
-                    count_large += 1
-                    if count_large <= warn_sample_limit:
-                        print(f"[WARN] {sensor}: index {i} jo_diff={jo_diff:.3f} "
-                              f"(|jo_diff| > 25, possible outlier)")
-                        print(f"       anl_omf={anl_omf:.3f}, ges_omf={ges_omf:.3f}, inv_err={inv_err:.3f}")
-                elif jo_diff == 0:
-                    count_zero += 1
-                    if count_zero <= warn_sample_limit:
-                        print(f"[WARN] {sensor}: index {i} jo_diff == 0 (check obs or inv_obs_err)")
-
-        # --- Warning summary ---
-        print(f"[INFO] {sensor}: |jo_diff|>25 count = {count_large}")
-        print(f"[INFO] {sensor}: jo_diff == 0 count = {count_zero}")
-
-
-
-        # --- Optional per-channel metadata pickle ---
-        if save_detail and count_assim > 0:
-            os.makedirs("./pickle", exist_ok=True)
-            filename = f"./pickle/{cycle}_sate_channel_{sensor}.pkl"
-            with open(filename, "wb") as f:
-                pickle.dump([sensor, list_channel, list_latitude, list_longitude], f)
-            print(f"[SAVE] Channel metadata: {filename}")
-
-
-
-        # --- Save detailed info, plot histogram, and save overall stat ---
-        if count_assim > 0:
-                        
-            # --- Save detailed per-point data to pickle_detail/ ---
-            if save_detail:            
-                
-                detail_dir  = "pickle_sate_detail"
-                detail_file = os.path.join(detail_dir, f"{cycle}_{sensor}_detail.pkl")
-
-                detail_dict = {
-                    "jo_diff": np.array(jo_diffs),
-                    "inv_obs_errors": np.array(inv_obs_errors),
-                    "latitude": np.array(sensor_lat),
-                    "longitude": np.array(sensor_lon),
-                    "elevation": np.array(sensor_elevation),
-                    "channel": np.array(sensor_channel)
-                }
-
-                with open(detail_file, "wb") as f:
-                    pickle.dump(detail_dict, f, protocol=pickle.HIGHEST_PROTOCOL)            
-            
-            # --- Continue with your normal workflow ---  
-            plot_jo_histogram(sensor, yyyy, mm, dd, hh,
-                              jo_diffs, inv_obs_errors,
-                              count_assim, count_large, count_zero,
-                              data_anl, cycle)
-
-            # --- Save stats ---
-            final_total_size[ss] = len(data_anl)
-            final_assim_size[ss] = count_assim
-            final_mean_jo_diff[ss] = np.mean(jo_diffs)
-            final_sum_jo_diff[ss] = np.sum(jo_diffs)
-            final_max_abs_jo_diff[ss] = np.max(np.abs(jo_diffs))
+    run_index = []
+    for ss, sensor in enumerate(sensor_types):
+        if f"diag_{sensor}_ges.{cycle}.nc4" not in existing:
+            print(f"[WARN] Missing file for {sensor}: "
+                  f"{file_prefix}/diag_{sensor}_ges.{cycle}.nc4")
+            continue
+        run_index.append(ss)
+    run_sensors = [sensor_types[ss] for ss in run_index]
+
+    # --- Sensors are independent: optionally run them in worker processes ---
+    sensor_args = (repeat(yyyy), repeat(mm), repeat(dd), repeat(hh),
+                   repeat(data_path), repeat(domain_str), repeat(save_detail))
+    if jobs > 1 and len(run_sensors) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(run_sensors))) as ex:
+            results = list(ex.map(_process_sensor, run_sensors, *sensor_args))
+    else:
+        # one histogram figure reused for every sensor
+        hist_fig, hist_ax = plt.subplots(figsize=(10, 6))
+        results = list(map(_process_sensor, run_sensors, *sensor_args, repeat(hist_ax)))
+        plt.close(hist_fig)
+
+    for ss, result in zip(run_index, results):
+        if result is None:
+            continue
+        (final_total_size[ss], final_assim_size[ss], final_mean_jo_diff[ss],
+         final_sum_jo_diff[ss], final_max_abs_jo_diff[ss]) = result
 
     # --- Save summary pickle ---
     save_legacy_pickle(sensor_types,
@@ -205,13 +237,25 @@ def analyze_sate(yyyy, mm, dd, hh, data_path, domain_str="True", save_detail=Fal
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 6:
-        sys.exit("Usage: di_conv.py YYYY MM DD HH DATAPATH [DOMAIN] [SAVE_DETAIL]")
-    yyyy, mm, dd, hh, data_path = sys.argv[1:6]
-    domain_str = sys.argv[6] if len(sys.argv) > 6 else "True"
-    save_detail = sys.argv[7].lower() in ["true"] if len(sys.argv) > 7 else False
-    
-    print(f"[INFO] Domain selection string: {domain_str}")
+    parser = argparse.ArgumentParser(
+        description="Jo-diff statistics for satellite radiance observations.")
+    parser.add_argument("yyyy")
+    parser.add_argument("mm")
+    parser.add_argument("dd")
+    parser.add_argument("hh")
+    parser.add_argument("data_path")
+    parser.add_argument("domain_str", nargs="?", default="True",
+                        help="Domain selection expression in anl_latitude/anl_longitude")
+    parser.add_argument("save_detail", nargs="?", default="false",
+                        help="'true' to save channel and per-point detail pickles")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes for the sensor loop")
+    args = parser.parse_args()
+
+    save_detail = args.save_detail.lower() in ["true"]
+
+    print(f"[INFO] Domain selection string: {args.domain_str}")
     print(f"[INFO] Save detailed pickle: {save_detail}")
-    
-    analyze_sate(yyyy, mm, dd, hh, data_path, domain_str, save_detail)
+
+    analyze_sate(args.yyyy, args.mm, args.dd, args.hh, args.data_path,
+                 args.domain_str, save_detail, jobs=args.jobs)
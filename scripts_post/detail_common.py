@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the per-point detail files written with SAVE_DETAIL=true.
+
+Used by scripts_post/plot_conv_spatial_detail.py and
+scripts_post/plot_sate_spatial_detail.py (one map per detail file,
+written to ./figures_detail) and by scripts_util/read_conv_detail.py.
+Detail files are pickles of one structured array, or .npz with
+DI_DETAIL_FORMAT=npz, named <cycle>_<sensor>_detail.pkl|.npz.
+"""
+
+import os
+import sys
+import pickle
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+try:
+    import cartopy.crs as ccrs
+    import cartopy.feature as cfeature
+    from shapely.geometry import box
+    HAS_CARTOPY = True
+except ImportError:
+    HAS_CARTOPY = False
+
+
+# ---------------------------------------------------------
+# Utility
+# ---------------------------------------------------------
+
+def parse_detail_name(fname):
+    """
+    Example: "2024121306_conv_ps_detail.pkl" → (2024121306, "conv_ps")
+    """
+    parts = os.path.splitext(os.path.basename(fname))[0].split("_")
+    return int(parts[0]), "_".join(parts[1:-1])
+
+
+def load_detail(path):
+    """Load a detail file: .npz (columns read on access) or .pkl."""
+    if path.endswith(".npz"):
+        return np.load(path)
+    # 1 MiB buffer: fewer read calls on networked scratch file systems
+    with open(path, "rb", buffering=1 << 20) as f:
+        return pickle.load(f)
+
+
+def thin_points(lon, lat, cell=0.25, max_points=50000):
+    """
+    Keep one point per cell x cell degree box when there are more than
+    max_points; at s=1 the map looks the same for far fewer points to
+    project.  Returns the kept (lon, lat) in their original order.
+    """
+    if len(lat) <= max_points:
+        return lon, lat
+    ix = np.floor(lon / cell).astype(np.int64)
+    iy = np.floor(lat / cell).astype(np.int64)
+    _, keep = np.unique((ix << 32) | (iy & 0xFFFFFFFF), return_index=True)
+    keep.sort()
+    return lon[keep], lat[keep]
+
+
+def cycle_range(start_cycle, end_cycle):
+    """Return all hourly cycles between start_cycle and end_cycle as ints."""
+    dates = pd.date_range(pd.to_datetime(str(start_cycle), format="%Y%m%d%H"),
+                          pd.to_datetime(str(end_cycle), format="%Y%m%d%H"),
+                          freq="h")
+    cycles = dates.year * 1000000 + dates.month * 10000 + dates.day * 100 + dates.hour
+    return frozenset(cycles.tolist())
+
+
+# ---------------------------------------------------------
+# Map features
+# ---------------------------------------------------------
+
+# Features reused by every map drawn in this process
+_map_features = None
+
+# Above this many obs the map shows a 2-D count histogram instead of points
+DENSITY_MIN_POINTS = 100000
+
+
+def map_features():
+    """
+    Coastline, border and state features for the RRFS-A domain.
+
+    The Natural Earth geometries are read and filtered to the domain once
+    per process; every map then shares the same geometry objects, so
+    cartopy also reuses their projected paths.  Returns a list of
+    (feature, linewidth).
+    """
+    global _map_features
+    if _map_features is not None:
+        return _map_features
+
+    # 140E–10W in -180..180 longitudes: two boxes either side of the dateline
+    domain = box(140, 0, 180, 85).union(box(-180, 0, -10, 85))
+
+    _map_features = []
+    for feature, linewidth in [(cfeature.COASTLINE, 0.7),
+                               (cfeature.BORDERS, 0.5),
+                               (cfeature.STATES, 0.4)]:
+        try:
+            # 110m: the scale cartopy's "auto" picks for this extent
+            feature = feature.with_scale("110m")
+            geoms = [g for g in feature.geometries() if g.intersects(domain)]
+        except Exception:
+            print(f"[WARN] Could not load {feature.name} boundaries.")
+            continue
+        _map_features.append((cfeature.ShapelyFeature(geoms, ccrs.PlateCarree(),
+                                                      **feature.kwargs), linewidth))
+    return _map_features
+
+
+# ---------------------------------------------------------
+# Plotting
+# ---------------------------------------------------------
+
+def build_map():
+    """
+    Create the detail map: RRFS-A extent, features, gridlines and an
+    empty scatter whose points each file fills in.  Returns
+    (fig, ax, points).
+    """
+    fig = plt.figure(figsize=(10, 5))
+
+    # Projection centered at 180° so RRFS-A domain looks correct
+    proj = ccrs.PlateCarree(central_longitude=180)
+    ax = plt.axes(projection=proj)
+    
+    # RRFS-A domain: 0–85N, 140E–10W  (stored as 140 → 350 in 0–360)
+    ax.set_extent([140, 350, 0, 85], crs=ccrs.PlateCarree())
+    
+    # Coastlines, borders, states
+    for feature, linewidth in map_features():
+        ax.add_feature(feature, linewidth=linewidth)
+    
+    # ----------------------------------------------------------
+    # Gridlines every 10°, small labels
+    # ----------------------------------------------------------
+    gl = ax.gridlines(
+        draw_labels=True,
+        linewidth=0.4,
+        linestyle=":",
+        color="gray",
+        xlocs=range(-180, 181, 10),  # longitude every 10°
+        ylocs=range(0, 91, 10)       # latitude every 10°
+    )
+    
+    # Hide top/right labels for cleaner map
+    gl.right_labels = False
+    gl.top_labels = False
+    
+    # Reduce font size
+    gl.xlabel_style = {"size": 8}
+    gl.ylabel_style = {"size": 8}
+
+    # Obs are given in the map's own x (lon - 180, wrapped), so cartopy
+    # does not reproject every point
+    points = ax.scatter([], [], s=1, alpha=0.7, transform=proj)
+    return fig, ax, points
+
+
+# Scatter map reused by every (non-dense) file drawn in this process
+_scatter_map = None
+
+
+def plot_spatial_distribution(pkl_path, cycle, sensor, outdir):
+    global _scatter_map
+    data = load_detail(pkl_path)
+
+    lat = np.asarray(data["latitude"])
+    lon = np.asarray(data["longitude"]) 
+
+    if not HAS_CARTOPY:
+        sys.exit("[ERROR] Cartopy is required for this script. Please install cartopy.")
+
+    # ----------------------------------------------------------
+    # Plot obs (lon in 0–360 → map x)
+    # ----------------------------------------------------------
+    dense = len(lat) > DENSITY_MIN_POINTS
+    if dense:
+        # Dense field: markers would overplot, so draw counts per 0.5° box
+        fig, ax, points = build_map()
+        points.remove()
+        counts, xedges, yedges = np.histogram2d(
+            np.mod(lon, 360) - 180, lat,
+            bins=[np.arange(-40, 170.5, 0.5), np.arange(0, 85.5, 0.5)])
+        mesh = ax.pcolormesh(xedges, yedges, np.ma.masked_equal(counts.T, 0),
+                             transform=ax.projection, shading="flat")
+        fig.colorbar(mesh, ax=ax, shrink=0.7, label="Obs per 0.5° box")
+    else:
+        # Same map for every file: only the points and title change
+        if _scatter_map is None:
+            _scatter_map = build_map()
+            # Fixed extent, labels and two-line title: solve the layout
+            # once, with a stand-in title, instead of for every file
+            _scatter_map[1].set_title("sensor  YYYYMMDDHH\nSpatial Distribution (N=0)")
+            _scatter_map[0].tight_layout()
+        fig, ax, points = _scatter_map
+        plot_lon, plot_lat = thin_points(lon, lat)
+        points.set_offsets(np.column_stack([np.mod(plot_lon, 360) - 180, plot_lat]))
+    
+    # Title
+    ax.set_title(f"{sensor}  {cycle}\nSpatial Distribution (N={len(lat)})")
+
+    # Save
+    outpath = os.path.join(outdir, f"{cycle}_{sensor}_detail.png")
+    if dense:
+        fig.tight_layout()
+    # zlib level 1: much faster encode for a slightly larger PNG
+    fig.savefig(outpath, dpi=150, pil_kwargs={"compress_level": 1})
+    if dense:
+        plt.close(fig)
+    print(f"[INFO] Saved: {outpath}")
+
+
+# ---------------------------------------------------------
+# Driver
+# ---------------------------------------------------------
+
+def run_detail_maps(description, detail_dir):
+    """
+    Command-line driver shared by the plot_*_spatial_detail.py scripts:
+    map every detail file in detail_dir whose cycle lies in the requested
+    window.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("start_cycle", help="First cycle, YYYYMMDDHH")
+    parser.add_argument("end_cycle", help="Last cycle, YYYYMMDDHH")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes for the per-file maps")
+    args = parser.parse_args()
+
+    if not HAS_CARTOPY:
+        print("[WARN] cartopy not found. Using simple lat/lon plot.")
+
+    start_cycle = args.start_cycle
+    end_cycle   = args.end_cycle
+
+    # Make output directory
+    outdir = "figures_detail"
+    os.makedirs(outdir, exist_ok=True)
+
+    valid_cycles = cycle_range(start_cycle, end_cycle)
+
+    # One directory scan; only files inside the cycle window are kept and sorted
+    n_files = 0
+    run_files = []
+    if os.path.isdir(detail_dir):
+        for entry in os.scandir(detail_dir):
+            if entry.name.endswith((".pkl", ".npz")):
+                n_files += 1
+                cycle, sensor = parse_detail_name(entry.name)
+                if cycle in valid_cycles:
+                    run_files.append((entry.path, cycle, sensor))
+    if n_files == 0:
+        print(f"[WARN] No {detail_dir}/*.pkl or *.npz found")
+        sys.exit(0)
+    run_files.sort()
+
+    print(f"[INFO] Searching cycles from {start_cycle} to {end_cycle}")
+    print(f"[INFO] Total pickle files: {n_files}")
+
+    # Each map is independent: optionally render them in worker processes
+    plot_one = partial(plot_spatial_distribution, outdir=outdir)
+    if args.jobs > 1 and len(run_files) > 1:
+        if HAS_CARTOPY:
+            map_features()   # load once here; forked workers inherit the cache
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(run_files))) as ex:
+            list(ex.map(plot_one, *zip(*run_files)))
+    else:
+        for pkl_path, cycle, sensor in run_files:
+            plot_one(pkl_path, cycle, sensor)
+
+    print(f"[INFO] Completed. Plotted {len(run_files)} files.")
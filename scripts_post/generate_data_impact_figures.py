@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 Modernized Data Impact Plotter
-Reads pickle files under ./pickle and outputs figures to ./figures_post.
+Reads pickle (or .npz) files under ./pickle and outputs figures to ./figures_post.
 
 Features:
  - Matches original numeric logic (including conv + conv_uv for Conventional)
@@ -10,15 +10,26 @@ Features:
  - Right-aligned, comma-formatted summary text above plots
  - Darker dashed gridlines for clarity
  - CLI switch: --mode [each|total|both]
+ - CLI switch: --jobs N renders the per-cycle figures in N processes
+ - CLI switch: --dpi N (default 150 per-cycle, 300 for the total figure)
 """
 
 import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pickle
 from pathlib import Path
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from tqdm import tqdm
 
+# Satellite rows drawn as IR (red) and MW (blue); the rest are conventional
+IR_INDEX = np.array([0, 1, 10, 11, 12, 13])
+MW_INDEX = np.array([2, 3, 4, 5, 6, 7, 8, 9, 14, 15, 16, 17])
+
 
 # ==========================================================
 #  Utility
@@ -29,6 +40,26 @@ def read_pickle(file_path):
         return pickle.load(f)
 
 
+STAT_FIELDS = ("total_size", "assim_size", "mean_jo", "sum_jo", "max_abs_jo")
+
+
+def read_stats(pickle_dir, stem, available):
+    """
+    Read one {cycle}_{label} summary in the legacy 6-element layout.
+
+    The .npz companion written by save_legacy_pickle is preferred (plain
+    arrays, no unpickling); legacy runs fall back to the .pkl.  available
+    is the set of file names in pickle_dir.  Returns None if neither
+    file exists.
+    """
+    if f"{stem}.npz" in available:
+        with np.load(pickle_dir / f"{stem}.npz") as data:
+            return [data["sensor_types"].tolist()] + [data[k] for k in STAT_FIELDS]
+    if f"{stem}.pkl" in available:
+        return read_pickle(pickle_dir / f"{stem}.pkl")
+    return None
+
+
 # ==========================================================
 #  Per-cycle Plot
 # ==========================================================
@@ -46,15 +77,25 @@ def plot_cycle(
     conv_assim_size,
     colors,
     outdir,
+    dpi=150,
+    axes=None,
 ):
-    """Plot and save one analysis cycle figure."""
-    import matplotlib.gridspec as gridspec
-
-    fig = plt.figure(figsize=(18, 8), constrained_layout=False)
-    gs = gridspec.GridSpec(1, 3, width_ratios=[1, 1, 1], wspace=0.10)
-    ax1 = plt.subplot(gs[0])
-    ax2 = plt.subplot(gs[1], sharey=ax1)
-    ax3 = plt.subplot(gs[2], sharey=ax1)
+    """
+    Plot and save one analysis cycle figure.
+
+    axes is an optional (fig, ax1, ax2, ax3) from cycle_figure(), reused
+    across cycles; it is cleared first and left open.  By default a new
+    figure is created and closed.
+    """
+    own_fig = axes is None
+    if own_fig:
+        fig, ax1, ax2, ax3 = cycle_figure()
+    else:
+        fig, ax1, ax2, ax3 = axes
+        for ax in (ax1, ax2, ax3):
+            ax.cla()
+        for text in list(fig.texts):
+            text.remove()
 
     # -------- Bar 1: Total Impact --------
     ax1.barh(range(len(all_sensor_type)), all_sum_jo_diff, color=colors)
@@ -81,30 +122,48 @@ def plot_cycle(
     fmt = lambda x: f"{x:,.0f}"
     fig.suptitle(f"Date = {datestr}", fontsize=14, x=0.52, y=0.93)
 
+    sate_ir_total = sate_ir_sum_jo_diff.sum()
+    mw_total = sate_sum_jo_diff.sum() - sate_ir_total
+    sate_ir_assim = sate_ir_assim_size.sum()
+    mw_assim = sate_assim_size.sum() - sate_ir_assim
+
     fig.text(0.36, 0.930,
-             f"Total Impact, MW Satellite = {fmt(sum(sate_sum_jo_diff) - sum(sate_ir_sum_jo_diff))}",
+             f"Total Impact, MW Satellite = {fmt(mw_total)}",
              color="blue", fontsize=13, ha="right", va="bottom")
     fig.text(0.36, 0.907,
-             f"Total Impact, IR Satellite = {fmt(sum(sate_ir_sum_jo_diff))}",
+             f"Total Impact, IR Satellite = {fmt(sate_ir_total)}",
              color="red", fontsize=13, ha="right", va="bottom")
     fig.text(0.36, 0.884,
-             f"Total Impact, Conventional = {fmt(sum(conv_sum_jo_diff))}",
+             f"Total Impact, Conventional = {fmt(conv_sum_jo_diff.sum())}",
              fontsize=13, ha="right", va="bottom")
 
     fig.text(0.90, 0.930,
-             f"Total Assim, MW Satellite = {fmt(sum(sate_assim_size) - sum(sate_ir_assim_size))}",
+             f"Total Assim, MW Satellite = {fmt(mw_assim)}",
              color="blue", fontsize=13, ha="right", va="bottom")
     fig.text(0.90, 0.907,
-             f"Total Assim, IR Satellite = {fmt(sum(sate_ir_assim_size))}",
+             f"Total Assim, IR Satellite = {fmt(sate_ir_assim)}",
              color="red", fontsize=13, ha="right", va="bottom")
     fig.text(0.90, 0.884,
-             f"Total Assim, Conventional = {fmt(sum(conv_assim_size))}",
+             f"Total Assim, Conventional = {fmt(conv_assim_size.sum())}",
              fontsize=13, ha="right", va="bottom")
 
     fig.tight_layout(rect=[0, 0, 1, 0.90])
     out_path = outdir / f"{datestr}-fsoi-proxy.png"
-    fig.savefig(out_path, dpi=300, bbox_inches="tight")
-    plt.close(fig)
+    fig.savefig(out_path, dpi=dpi)
+    if own_fig:
+        plt.close(fig)
+
+
+def cycle_figure():
+    """Create the per-cycle figure: three bar panels sharing the y axis."""
+    import matplotlib.gridspec as gridspec
+
+    fig = plt.figure(figsize=(18, 8), constrained_layout=False)
+    gs = gridspec.GridSpec(1, 3, width_ratios=[1, 1, 1], wspace=0.10)
+    ax1 = plt.subplot(gs[0])
+    ax2 = plt.subplot(gs[1], sharey=ax1)
+    ax3 = plt.subplot(gs[2], sharey=ax1)
+    return fig, ax1, ax2, ax3
 
 
 # ==========================================================
@@ -124,6 +183,7 @@ def plot_total_summary(
     alltime_conv_assim_size,
     colors,
     outdir,
+    dpi=300,
 ):
     """Plot averaged-per-cycle total data impact."""
     import matplotlib.gridspec as gridspec
@@ -155,51 +215,128 @@ def plot_total_summary(
     fmt = lambda x: f"{x:,.0f}"
     fig.suptitle(f"Cycle-Averaged Total Impact ({case_str})", fontsize=14, x=0.52, y=0.93)
 
+    sate_ir_total = alltime_sate_ir_sum_jo_diff.sum()
+    mw_total = alltime_sate_sum_jo_diff.sum() - sate_ir_total
+    sate_ir_assim = alltime_sate_ir_assim_size.sum()
+    mw_assim = alltime_sate_assim_size.sum() - sate_ir_assim
+
     fig.text(0.36, 0.930,
-             f"Avg Total Impact, MW Satellite = {fmt((sum(alltime_sate_sum_jo_diff) - sum(alltime_sate_ir_sum_jo_diff)) / datestr_len)}",
+             f"Avg Total Impact, MW Satellite = {fmt(mw_total / datestr_len)}",
              color="blue", fontsize=13, ha="right", va="bottom")
     fig.text(0.36, 0.907,
-             f"Avg Total Impact, IR Satellite = {fmt(sum(alltime_sate_ir_sum_jo_diff) / datestr_len)}",
+             f"Avg Total Impact, IR Satellite = {fmt(sate_ir_total / datestr_len)}",
              color="red", fontsize=13, ha="right", va="bottom")
     fig.text(0.36, 0.884,
-             f"Avg Total Impact, Conventional = {fmt(sum(alltime_conv_sum_jo_diff) / datestr_len)}",
+             f"Avg Total Impact, Conventional = {fmt(alltime_conv_sum_jo_diff.sum() / datestr_len)}",
              fontsize=13, ha="right", va="bottom")
 
     fig.text(0.90, 0.930,
-             f"Avg Assim, MW Satellite = {fmt((sum(alltime_sate_assim_size) - sum(alltime_sate_ir_assim_size)) / datestr_len)}",
+             f"Avg Assim, MW Satellite = {fmt(mw_assim / datestr_len)}",
              color="blue", fontsize=13, ha="right", va="bottom")
     fig.text(0.90, 0.907,
-             f"Avg Assim, IR Satellite = {fmt(sum(alltime_sate_ir_assim_size) / datestr_len)}",
+             f"Avg Assim, IR Satellite = {fmt(sate_ir_assim / datestr_len)}",
              color="red", fontsize=13, ha="right", va="bottom")
     fig.text(0.90, 0.884,
-             f"Avg Assim, Conventional = {fmt(sum(alltime_conv_assim_size) / datestr_len)}",
+             f"Avg Assim, Conventional = {fmt(alltime_conv_assim_size.sum() / datestr_len)}",
              fontsize=13, ha="right", va="bottom")
 
     fig.tight_layout(rect=[0, 0, 1, 0.90])
-    fig.savefig(outdir / "total-fsoi-proxy.png", dpi=300, bbox_inches="tight")
+    fig.savefig(outdir / "total-fsoi-proxy.png", dpi=dpi)
     plt.close(fig)
 
 
+# ==========================================================
+#  Per-cycle Work
+# ==========================================================
+# Per-cycle figure reused by every cycle drawn in this process
+_cycle_axes = None
+
+
+def process_cycle(d, pickle_dir, available, fig_dir, mode, colors, len_conv_data, dpi=150):
+    """
+    Read one cycle's summaries and draw its figure (mode each/both).
+
+    Cycles are independent, so this runs in worker processes.  Returns
+    (sensor_type, cycle_sum, cycle_assim), the per-row satellite +
+    conventional totals added into the all-time totals, or None when a
+    summary is missing.
+    """
+    sate = read_stats(pickle_dir, f"{d}_sate", available)
+    conv = read_stats(pickle_dir, f"{d}_conv", available)
+    conv_uv = read_stats(pickle_dir, f"{d}_conv_uv", available)
+
+    if sate is None or conv is None or conv_uv is None:
+        return None
+
+    (
+        sate_sensor_type, _, sate_assim_size, sate_mean_jo_diff, sate_sum_jo_diff, _
+    ) = sate
+    (
+        conv_sensor_type, _, conv_assim_size, conv_mean_jo_diff, conv_sum_jo_diff, _
+    ) = conv
+    (
+        convuv_sensor_type, _, convuv_assim_size, convuv_mean_jo_diff, convuv_sum_jo_diff, _
+    ) = conv_uv
+
+    sensor_type = sate_sensor_type + conv_sensor_type + convuv_sensor_type
+    total_sum = np.concatenate([sate_sum_jo_diff, conv_sum_jo_diff, convuv_sum_jo_diff])
+    mean_jo_diff = np.concatenate([sate_mean_jo_diff, conv_mean_jo_diff, convuv_mean_jo_diff])
+    assim_size = np.concatenate([sate_assim_size, conv_assim_size, convuv_assim_size])
+
+    # Conventional totals = 7 conv + 1 conv_uv (legacy logic)
+    conv_total_sum = np.zeros(len_conv_data)
+    conv_total_sum[0:len(conv_sum_jo_diff)] = conv_sum_jo_diff
+    conv_total_sum[-1] = convuv_sum_jo_diff[-1]
+
+    conv_total_assim = np.zeros(len_conv_data)
+    conv_total_assim[0:len(conv_assim_size)] = conv_assim_size
+    conv_total_assim[-1] = convuv_assim_size[-1]
+
+    sate_ir_sum = sate_sum_jo_diff[IR_INDEX]
+    sate_ir_assim = sate_assim_size[IR_INDEX]
+
+    # -------- Per-cycle plots --------
+    if mode in ["each", "both"]:
+        global _cycle_axes
+        if _cycle_axes is None:
+            _cycle_axes = cycle_figure()
+        plot_cycle(
+            d,
+            sensor_type,
+            total_sum,
+            mean_jo_diff,
+            assim_size,
+            sate_sum_jo_diff,
+            sate_ir_sum,
+            conv_total_sum,
+            sate_assim_size,
+            sate_ir_assim,
+            conv_total_assim,
+            colors,
+            fig_dir,
+            dpi=dpi,
+            axes=_cycle_axes,
+        )
+
+    cycle_sum = np.concatenate([sate_sum_jo_diff, conv_total_sum])
+    cycle_assim = np.concatenate([sate_assim_size, conv_total_assim])
+    return sensor_type, cycle_sum, cycle_assim
+
+
 # ==========================================================
 #  Main Function
 # ==========================================================
-def main(case_str, mode="each"):
+def main(case_str, mode="each", jobs=1, dpi=None):
     base_dir = Path(__file__).resolve().parents[1]
     pickle_dir = base_dir / "pickle"
     fig_dir = base_dir / "figures_post" / case_str
     fig_dir.mkdir(parents=True, exist_ok=True)
 
-    ir_index = [0, 1, 10, 11, 12, 13]
-    mw_index = [2, 3, 4, 5, 6, 7, 8, 9, 14, 15, 16, 17]
-    colors = ["red" if i in ir_index else "blue" if i in mw_index else "black" for i in range(26)]
+    colors = ["red" if i in IR_INDEX else "blue" if i in MW_INDEX else "black" for i in range(26)]
 
     # Generate datetimes from 2024-09-25 06 UTC to 2024-09-30 23 UTC
-    datestr_list = []
-    for day in range(25, 31):              # 25 to 30 inclusive
-        start_hour = 6 if day == 25 else 0
-        end_hour = 24
-        for h in range(start_hour, end_hour):
-            datestr_list.append(f"202409{day:02d}{h:02d}")    
+    datestr_list = pd.date_range("2024-09-25 06:00", "2024-09-30 23:00",
+                                 freq="h").strftime("%Y%m%d%H").tolist()
 
     # Data type information
     len_data_type, len_sate_data, len_conv_data = 26, 18, 8
@@ -207,81 +344,41 @@ def main(case_str, mode="each"):
     # Accumulators for total plot
     alltime_sum_jo_diff = np.zeros(len_data_type)
     alltime_assim_size = np.zeros(len_data_type)
-    alltime_sate_sum_jo_diff = np.zeros(len_sate_data)
-    alltime_sate_ir_sum_jo_diff = np.zeros(6)
-    alltime_conv_sum_jo_diff = np.zeros(len_conv_data)
-    alltime_sate_assim_size = np.zeros(len_sate_data)
-    alltime_sate_ir_assim_size = np.zeros(6)
-    alltime_conv_assim_size = np.zeros(len_conv_data)
-
-    for d in tqdm(datestr_list, desc="Processing cycles"):
-        datapath = "." if case_str == "full-domain" else "."
-        date_dir = pickle_dir / datapath
-
-        sate_file = date_dir / f"{d}_sate.pkl"
-        conv_file = date_dir / f"{d}_conv.pkl"
-        conv_uv_file = date_dir / f"{d}_conv_uv.pkl"
-
-        if not (sate_file.exists() and conv_file.exists() and conv_uv_file.exists()):
-            continue
 
-        sate = read_pickle(sate_file)
-        conv = read_pickle(conv_file)
-        conv_uv = read_pickle(conv_uv_file)
-
-        (
-            sate_sensor_type, _, sate_assim_size, sate_mean_jo_diff, sate_sum_jo_diff, _
-        ) = sate
-        (
-            conv_sensor_type, _, conv_assim_size, conv_mean_jo_diff, conv_sum_jo_diff, _
-        ) = conv
-        (
-            convuv_sensor_type, _, convuv_assim_size, convuv_mean_jo_diff, convuv_sum_jo_diff, _
-        ) = conv_uv
-
-        sensor_type = sate_sensor_type + conv_sensor_type + convuv_sensor_type
-        total_sum = np.concatenate([sate_sum_jo_diff, conv_sum_jo_diff, convuv_sum_jo_diff])
-        mean_jo_diff = np.concatenate([sate_mean_jo_diff, conv_mean_jo_diff, convuv_mean_jo_diff])
-        assim_size = np.concatenate([sate_assim_size, conv_assim_size, convuv_assim_size])
-
-        # Conventional totals = 7 conv + 1 conv_uv (legacy logic)
-        conv_total_sum = np.zeros(len_conv_data)
-        conv_total_sum[0:len(conv_sum_jo_diff)] = conv_sum_jo_diff
-        conv_total_sum[-1] = convuv_sum_jo_diff[-1]
-
-        conv_total_assim = np.zeros(len_conv_data)
-        conv_total_assim[0:len(conv_assim_size)] = conv_assim_size
-        conv_total_assim[-1] = convuv_assim_size[-1]
-
-        # -------- Per-cycle plots --------
-        if mode in ["each", "both"]:
-            plot_cycle(
-                d,
-                sensor_type,
-                total_sum,
-                mean_jo_diff,
-                assim_size,
-                sate_sum_jo_diff,
-                sate_sum_jo_diff[ir_index],
-                conv_total_sum,
-                sate_assim_size,
-                sate_assim_size[ir_index],
-                conv_total_assim,
-                colors,
-                fig_dir,
-            )
+    datapath = "." if case_str == "full-domain" else "."
+    date_dir = pickle_dir / datapath
+
+    # list the pickle directory once instead of probing each file per cycle
+    available = {p.name for p in date_dir.iterdir()} if date_dir.is_dir() else set()
+
+    cycle_work = partial(process_cycle, pickle_dir=date_dir, available=available, fig_dir=fig_dir,
+                         mode=mode, colors=colors,
+                         len_conv_data=len_conv_data, dpi=dpi or 150)
+
+    # -------- Cycles are independent: optionally render them in worker processes --------
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            results = list(tqdm(ex.map(cycle_work, datestr_list),
+                                total=len(datestr_list), desc="Processing cycles"))
+    else:
+        results = [cycle_work(d) for d in tqdm(datestr_list, desc="Processing cycles")]
+
+    for result in results:
+        if result is None:
+            continue
+        sensor_type, cycle_sum, cycle_assim = result
 
         # -------- Accumulate totals --------
-        alltime_sum_jo_diff[0:len_sate_data] += sate_sum_jo_diff
-        alltime_sum_jo_diff[len_sate_data:] += conv_total_sum
-        alltime_assim_size[0:len_sate_data] += sate_assim_size
-        alltime_assim_size[len_sate_data:] += conv_total_assim
-        alltime_sate_sum_jo_diff += sate_sum_jo_diff
-        alltime_sate_ir_sum_jo_diff += sate_sum_jo_diff[ir_index]
-        alltime_conv_sum_jo_diff += conv_total_sum
-        alltime_sate_assim_size += sate_assim_size
-        alltime_sate_ir_assim_size += sate_assim_size[ir_index]
-        alltime_conv_assim_size += conv_total_assim
+        alltime_sum_jo_diff += cycle_sum
+        alltime_assim_size += cycle_assim
+
+    # Satellite / IR / conventional totals are slices of the per-row totals
+    alltime_sate_sum_jo_diff = alltime_sum_jo_diff[:len_sate_data]
+    alltime_sate_ir_sum_jo_diff = alltime_sate_sum_jo_diff[IR_INDEX]
+    alltime_conv_sum_jo_diff = alltime_sum_jo_diff[len_sate_data:]
+    alltime_sate_assim_size = alltime_assim_size[:len_sate_data]
+    alltime_sate_ir_assim_size = alltime_sate_assim_size[IR_INDEX]
+    alltime_conv_assim_size = alltime_assim_size[len_sate_data:]
 
     # -------- Total averaged plot --------
     if mode in ["total", "both"]:
@@ -299,6 +396,7 @@ def main(case_str, mode="each"):
             alltime_conv_assim_size,
             colors,
             fig_dir,
+            dpi=dpi or 300,
         )
 
     print(f"--> Figures saved to {fig_dir}")
@@ -313,6 +411,10 @@ if __name__ == "__main__":
                         help="Case to process")
     parser.add_argument("--mode", choices=["each", "total", "both"], default="both",
                         help="Plot mode: 'each' = per-cycle only, 'total' = total only, 'both' = both types")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes for the per-cycle figures")
+    parser.add_argument("--dpi", type=int, default=None,
+                        help="Figure resolution (default: 150 per-cycle, 300 total)")
     args = parser.parse_args()
 
-    main(args.case, mode=args.mode)
+    main(args.case, mode=args.mode, jobs=args.jobs, dpi=args.dpi)
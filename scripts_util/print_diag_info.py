@@ -1,15 +1,42 @@
-from netCDF4 import Dataset
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    from netCDF4 import Dataset
+    HAS_H5PY = False
 
 # -- change this --
 #diag_file = "/scratch4/BMC/wrfruc/llin/2025-zrtrr2/240601_misc/20241213-ncdiag-rrfs-full/rrfs/na/prod/rrfs.20240927/06/diag_conv_t_anl.2024092706.nc4"   
 #diag_file = "/scratch4/BMC/wrfruc/llin/2025-zrtrr2/240601_misc/20241213-ncdiag-rrfs-full/rrfs/na/prod/rrfs.20240927/06/diag_conv_fed_anl.2024092706.nc4"   
 diag_file = "/scratch4/BMC/wrfruc/llin/2025-zrtrr2/240601_misc/20241213-ncdiag-rrfs-full/rrfs/na/prod/rrfs.20240927/06/diag_abi_g16_anl.2024092706.nc4"
 
-with Dataset(diag_file, 'r') as nc:
-    print("Variables in file:")
-    for v in nc.variables:
-        print(v)
+if HAS_H5PY:
+    # Header only: h5py lists the HDF5 objects without netCDF4's
+    # dimension and coordinate setup on open
+    with h5py.File(diag_file, "r") as f:
+        print("Variables in file:")
+        for v, obj in f.items():
+            # skip netCDF dimension-only scales, which netCDF4 does not list
+            name = obj.attrs.get("NAME", b"")
+            if isinstance(name, bytes) and name.startswith(b"This is a netCDF dimension but not"):
+                continue
+            print(v)
 
-    print("\nGlobal attributes:")
-    for attr in nc.ncattrs():
-        print(attr, "=", getattr(nc, attr))
+        print("\nGlobal attributes:")
+        for attr, val in f.attrs.items():
+            if attr.startswith("_"):   # netCDF4-internal, e.g. _NCProperties
+                continue
+            if isinstance(val, bytes):
+                val = val.decode()
+            elif getattr(val, "shape", ()) == (1,):   # netCDF4 shows these as scalars
+                val = val[0]
+            print(attr, "=", val)
+else:
+    with Dataset(diag_file, 'r') as nc:
+        print("Variables in file:")
+        for v in nc.variables:
+            print(v)
+
+        print("\nGlobal attributes:")
+        for attr in nc.ncattrs():
+            print(attr, "=", getattr(nc, attr))
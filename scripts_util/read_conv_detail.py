@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
-import pickle
+import os
 import sys
 import numpy as np
 
-def read_conv_detail(pkl_path):
-    # --- Load pickle ---
-    with open(pkl_path, "rb") as f:
-        data = pickle.load(f)
+# load_detail is shared with the scripts_post detail plots
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "scripts_post"))
+from detail_common import load_detail
+
+
+def read_conv_detail(pkl_path, n_show=10):
+    # --- Load pickle (or .npz) ---
+    data = load_detail(pkl_path)
 
     # --- Extract arrays ---
     jo_diff = data["jo_diff"]
@@ -17,7 +22,7 @@ def read_conv_detail(pkl_path):
     obstype = data["observation_type"]
 
     # --- Number of rows to show ---
-    n_show = min(10, len(jo_diff))
+    n_show = min(n_show, len(jo_diff))
 
     print(f"\n[INFO] File: {pkl_path}")
     print(f"[INFO] Total points: {len(jo_diff)}")
@@ -27,23 +32,25 @@ def read_conv_detail(pkl_path):
     print(f"{'Index':>5}  {'Lat':>8}  {'Lon':>9}  {'Press':>8}  {'ObsType':>10}  {'Jo_diff':>12}  {'InvErr':>8}")
     print("-" * 70)
 
-    # --- Print rows ---
-    for i in range(n_show):
-        print(f"{i:5d}  "
-              f"{lat[i]:8.3f}  "
-              f"{lon[i]:9.3f}  "
-              f"{press[i]:8.1f}  "
-              f"{str(obstype[i]):>10}  "
-              f"{jo_diff[i]:12.4f}  "
-              f"{inv_err[i]:8.4f}")
+    # --- Print rows (one formatting pass over the first n_show rows) ---
+    rows = np.empty((n_show, 7), dtype=object)
+    rows[:, 0] = np.arange(n_show)
+    rows[:, 1] = lat[:n_show]
+    rows[:, 2] = lon[:n_show]
+    rows[:, 3] = press[:n_show]
+    rows[:, 4] = obstype[:n_show]
+    rows[:, 5] = jo_diff[:n_show]
+    rows[:, 6] = inv_err[:n_show]
+    np.savetxt(sys.stdout, rows, fmt="%5d  %8.3f  %9.3f  %8.1f  %10s  %12.4f  %8.4f")
 
     print()
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        sys.exit("Usage: read_conv_detail.py <detail_pickle_file.pkl>")
+        sys.exit("Usage: read_conv_detail.py <detail_file.pkl|.npz> [N_ROWS]")
 
     pkl_path = sys.argv[1]
-    read_conv_detail(pkl_path)
+    n_show = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    read_conv_detail(pkl_path, n_show=n_show)
 